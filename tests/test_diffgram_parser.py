@@ -0,0 +1,117 @@
+'''
+DiffgramParser gives the same rows the xmltodict based client did
+'''
+import random
+import unittest
+from json import dumps, loads
+
+from pysimplesoap.client import SimpleXMLElement
+
+from wsEspolClient.DiffgramParser import iter_rows
+from wsEspolClient.FakeServer import OPERATIONS, diffgram
+
+try:
+    import xmltodict
+except ImportError:
+    xmltodict = None
+
+
+NAMESPACES = {
+    'http://schemas.xmlsoap.org/soap/envelope/': None,
+    'http://tempuri.org/': None,
+    'http://www.w3.org/2001/XMLSchema': None
+}
+
+DIFFGRAM = 'urn:schemas-microsoft-com:xml-diffgram-v1:diffgram'
+UNUSED = ('@urn:schemas-microsoft-com:xml-diffgram-v1:id',
+          '@urn:schemas-microsoft-com:xml-msdata:rowOrder', '@xmlns')
+
+
+def old_replace_special_chars(string):
+    return string.replace('\xf3', 'o').replace('\xe2', 'a').replace('\xed', 'i').replace(
+        '\xe9', 'e').replace('\xfa', 'u').replace('\xc1', 'A').replace('\xc9', 'E').replace(
+            '\xcd', 'I').replace('\xd3', 'O').replace('\xda', 'U').replace(
+                '\xf1', 'n').replace('\xd1', 'N')
+
+
+def old_rows(response, operation):
+    '''
+    The rows of a response as the client read them before DiffgramParser:
+    pysimplesoap xml, accents replaced, xmltodict, json round trip and
+    __remove_unused_items
+    '''
+    table = OPERATIONS[operation][0]
+    xml = SimpleXMLElement(response).as_xml().decode('UTF-8', 'replace')
+    document = loads(dumps(xmltodict.parse(old_replace_special_chars(xml),
+                                           process_namespaces=True, namespaces=NAMESPACES)))
+    result = document['Envelope']['Body'][operation + 'Response'][operation + 'Result']
+    # the old client failed on an empty NewDataSet, it is taken as no rows
+    rows = (result[DIFFGRAM]['NewDataSet'] or {}).get(table)
+    if rows is None:
+        return []
+    # a single row was a dict
+    for row in rows if isinstance(rows, list) else [rows]:
+        for name in UNUSED:
+            row.pop(name, None)
+    return rows if isinstance(rows, list) else [rows]
+
+
+@unittest.skipIf(xmltodict is None, 'xmltodict is needed to compare with the old parser')
+class DiffgramParserTest(unittest.TestCase):
+
+    def assert_same_rows(self, operation, rows):
+        response = diffgram(operation, rows)
+        self.assertEqual(list(iter_rows(response, OPERATIONS[operation][0])),
+                         old_rows(response, operation))
+
+    def test_empty(self):
+        self.assert_same_rows('wsConsultaCalificaciones', [])
+
+    def test_single_row(self):
+        self.assert_same_rows('wsConsultaPeriodoActual',
+                              [{'ANIO': '2017', 'TERMINO': '1', 'FECHAINICIO': '2017-05-02'}])
+
+    def test_omitted_columns(self):
+        self.assert_same_rows('wsConsultaCalificaciones', [
+            {'MATERIA': 'CALCULO', 'NOTA1': '70', 'NOTA2': None, 'VEZ': '1'},
+            {'MATERIA': 'FISICA', 'NOTA1': None, 'NOTA2': '65', 'VEZ': None}])
+
+    def test_blank_values(self):
+        self.assert_same_rows('wsConsultaCalificaciones',
+                              [{'MATERIA': '  CALCULO  ', 'NOTA1': ' ', 'ESTADO': ''}])
+
+    def test_spaces_table(self):
+        self.assert_same_rows('wsHorarioExamenes', [
+            {'FECHA': '2017-06-11T00:00:00', 'HORAINICIO': '10:00', 'HORAFIN': '12:00'},
+            {'FECHA': '2017-08-17T00:00:00', 'HORAINICIO': '09:00'}])
+
+    def test_accents(self):
+        self.assert_same_rows('wsConsultarPersonaPorNombres', [
+            {'NOMBRES': 'JOS\xc9 MAR\xcdA', 'APELLIDOS': 'NU\xd1EZ ORDO\xf1EZ',
+             'CARRERA': 'Ingenier\xeda en Computaci\xf3n', 'FACULTAD': 'FIEC \xdatil \xfaltimo'},
+            {'NOMBRES': '\xd3SCAR \xc1NGEL', 'APELLIDOS': 'M\xe2S'}])
+
+    def test_accents_a_acute(self):
+        # the old replace chain kept it, DiffgramParser translates it too
+        response = diffgram('wsConsultarPersonaPorNombres',
+                            [{'NOMBRES': 'ANDR\xc9S', 'APELLIDOS': 'Gonz\xe1lez'}])
+        self.assertEqual(list(iter_rows(response, 'DATOSPERSONA')),
+                         [{'NOMBRES': 'ANDRES', 'APELLIDOS': 'Gonzalez'}])
+
+    def test_diffgram_attributes(self):
+        response = diffgram('wsEstudiantesRegistrados',
+                            [{'CODESTUDIANTE': '201300001'}, {'CODESTUDIANTE': '201300002'}])
+        self.assertIn(b'diffgr:id=', response)
+        self.assertIn(b'msdata:rowOrder=', response)
+        self.assertEqual(list(iter_rows(response, 'ESTUDIANTESREGISTRADOS')),
+                         old_rows(response, 'wsEstudiantesRegistrados'))
+
+    def test_fake_rows(self):
+        rnd = random.Random(7)
+        for operation, (_, row) in OPERATIONS.items():
+            with self.subTest(operation=operation):
+                self.assert_same_rows(operation, [row(rnd, index) for index in range(5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
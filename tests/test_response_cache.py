@@ -0,0 +1,142 @@
+'''
+Ttl policies, eviction and modes of the ResponseCache
+'''
+import datetime
+import importlib
+import unittest
+from unittest import mock
+
+from wsEspolClient.ResponseCache import MINUTE, ResponseCache, grades_ttl
+
+# the package exports the class under the name of the module
+cache_module = importlib.import_module('wsEspolClient.ResponseCache')
+
+
+class Clock():
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class Fetch():
+    '''
+    fetch callable that counts the calls to the web service
+    '''
+
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+def grades(year, term):
+    return {'anio': str(year), 'termino': str(term), 'estudiante': '201300001'}
+
+
+class GradesTtlTest(unittest.TestCase):
+
+    def test_with_current_period(self):
+        cache = ResponseCache(':memory:', current_period=('2017', '1'))
+        self.assertIsNone(grades_ttl(cache, grades(2016, 2)))
+        self.assertEqual(grades_ttl(cache, grades(2017, 1)), 10 * MINUTE)
+        self.assertEqual(grades_ttl(cache, grades(2017, 2)), 10 * MINUTE)
+
+    def test_without_current_period(self):
+        cache = ResponseCache(':memory:')
+        year = datetime.date.today().year
+        self.assertIsNone(grades_ttl(cache, grades(year - 2, 2)))
+        self.assertEqual(grades_ttl(cache, grades(year - 1, 1)), 10 * MINUTE)
+        self.assertEqual(grades_ttl(cache, grades(year, 1)), 10 * MINUTE)
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch.object(cache_module, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = ResponseCache(':memory:', policies={'short': 10, 'never': None,
+                                                         'uncached': 0})
+        self.addCleanup(self.cache.close)
+
+    def call(self, operation, value, **params):
+        fetch = Fetch(value)
+        return self.cache.cached(operation, params or {'x': '1'}, fetch), fetch.calls
+
+    def test_hits_and_misses(self):
+        self.assertEqual(self.call('short', [1]), ([1], 1))
+        self.assertEqual(self.call('short', [2]), ([1], 0))
+        # the parameters are normalized
+        self.assertEqual(self.call('short', [3], x=' 1 '), ([1], 0))
+        self.assertEqual(self.call('never', [4]), ([4], 1))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 2))
+        self.assertEqual(stats['operations']['short'], {'hits': 2, 'misses': 1})
+
+    def test_expired_entries_are_fetched_again(self):
+        self.call('short', [1])
+        self.clock.now += 9
+        self.assertEqual(self.call('short', [2]), ([1], 0))
+        self.clock.now += 2
+        self.assertEqual(self.call('short', [2]), ([2], 1))
+        self.clock.now += 10 ** 6
+        self.call('never', [3])
+        self.clock.now += 10 ** 6
+        self.assertEqual(self.call('never', [4]), ([3], 0))
+
+    def test_ttl_zero_is_not_cached(self):
+        self.call('uncached', [1])
+        self.assertEqual(self.call('uncached', [2]), ([2], 1))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_eviction_keeps_the_most_recently_accessed(self):
+        self.cache.max_entries = 3
+        for name in ('a', 'b', 'c'):
+            self.clock.now += 1
+            self.call('never', [name], x=name)
+        self.clock.now += 1
+        self.call('never', ['a'], x='a')
+        self.clock.now += 1
+        self.call('never', ['d'], x='d')
+        self.assertEqual(self.cache.stats()['entries'], 3)
+        for name in ('a', 'c', 'd'):
+            self.assertEqual(self.call('never', ['new'], x=name), ([name], 0))
+        self.assertEqual(self.call('never', ['new'], x='b'), (['new'], 1))
+
+    def test_eviction_drops_expired_entries_first(self):
+        self.cache.max_entries = 2
+        self.call('never', ['a'], x='a')
+        # accessed after a, but expired when b is stored
+        self.clock.now += 1
+        self.call('short', ['old'], x='old')
+        self.clock.now += 20
+        self.call('never', ['b'], x='b')
+        self.assertEqual(self.cache.stats()['entries'], 2)
+        self.assertEqual(self.call('never', ['new'], x='a'), (['a'], 0))
+
+    def test_refresh_overwrites(self):
+        self.call('never', [1])
+        with self.cache.refresh():
+            self.assertEqual(self.call('never', [2]), ([2], 1))
+        self.assertEqual(self.call('never', [3]), ([2], 0))
+
+    def test_bypass_neither_reads_nor_writes(self):
+        self.call('never', [1])
+        with self.cache.bypass():
+            self.assertEqual(self.call('never', [2]), ([2], 1))
+            self.assertEqual(self.call('short', [3]), ([3], 1))
+        self.assertEqual(self.call('never', [4]), ([1], 0))
+        self.assertEqual(self.call('short', [5]), ([5], 1))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
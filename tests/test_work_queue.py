@@ -0,0 +1,101 @@
+'''
+Leases of the WorkQueue of the crawl
+'''
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from wsEspolClient.Crawl import WorkQueue
+
+
+LEASE = 0.2
+
+
+class WorkQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.queue = self.open()
+        self.queue.put('info', [('201300001',)])
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.directory)
+
+    def open(self, max_attempts=3):
+        return WorkQueue(os.path.join(self.directory, 'crawl.sqlite3'), LEASE, max_attempts)
+
+    def expire(self):
+        time.sleep(LEASE * 1.5)
+
+    def test_expired_lease_is_leased_again(self):
+        first = self.queue.lease('1')
+        self.assertIsNone(self.queue.lease('2'))
+        self.expire()
+        second = self.queue.lease('2')
+        self.assertEqual((second.id, second.owner, second.attempts), (first.id, '2', 2))
+        self.assertEqual(self.queue.counts()['leased'], 1)
+
+    def test_extend_keeps_the_lease(self):
+        unit = self.queue.lease('1')
+        time.sleep(LEASE * 0.75)
+        self.assertTrue(self.queue.extend(unit))
+        time.sleep(LEASE * 0.75)
+        self.assertIsNone(self.queue.lease('2'))
+
+    def test_stale_owner_cannot_complete(self):
+        stale = self.queue.lease('1')
+        self.expire()
+        owner = self.queue.lease('2')
+        self.assertFalse(self.queue.extend(stale))
+        self.assertFalse(self.queue.complete(stale, ['stale'], [('grades', ('1', '2017', '1'))]))
+        self.assertFalse(self.queue.fail(stale, 'stale error'))
+        self.assertEqual(list(self.queue.results('info')), [])
+        self.assertTrue(self.queue.complete(owner, ['owner']))
+        self.assertFalse(self.queue.complete(stale, ['stale']))
+        self.assertEqual(list(self.queue.results('info')),
+                         [{'student': '201300001', 'info': ['owner']}])
+        self.assertEqual(self.queue.counts(), {'pending': 0, 'leased': 0, 'done': 1, 'failed': 0})
+
+    def test_same_owner_after_expiry_has_another_lease(self):
+        stale = self.queue.lease('1')
+        self.expire()
+        current = self.queue.lease('1')
+        self.assertFalse(self.queue.complete(stale, ['stale']))
+        self.assertTrue(self.queue.complete(current, ['current']))
+
+    def test_requeue_dead_owner(self):
+        dead = self.queue.lease('1')
+        self.assertEqual(self.queue.requeue('1'), 1)
+        unit = self.queue.lease('2')
+        self.assertEqual(unit.id, dead.id)
+        self.assertFalse(self.queue.complete(dead, ['dead']))
+        self.assertTrue(self.queue.complete(unit, ['alive']))
+
+    def test_crashed_owner_unit_fails_after_max_attempts(self):
+        self.queue.close()
+        self.queue = self.open(max_attempts=2)
+        self.queue.lease('1')
+        self.expire()
+        self.queue.lease('2')
+        self.expire()
+        self.assertIsNone(self.queue.lease('3'))
+        self.assertEqual(self.queue.counts()['failed'], 1)
+        self.assertFalse(self.queue.queued())
+
+    def test_fail_retries_until_max_attempts(self):
+        self.queue.close()
+        self.queue = self.open(max_attempts=2)
+        self.assertTrue(self.queue.fail(self.queue.lease('1'), 'SoapFault: first'))
+        unit = self.queue.lease('1')
+        self.assertEqual(unit.attempts, 2)
+        self.assertTrue(self.queue.fail(unit, 'SoapFault: second'))
+        self.assertEqual(self.queue.counts()['failed'], 1)
+        self.assertEqual(self.queue.retry_failed(), 1)
+        self.assertEqual(self.queue.lease('1').attempts, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
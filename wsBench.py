@@ -0,0 +1,167 @@
+'''
+wsBench measures Client against the local FakeServer
+:argv: options of the benchmark
+
+$python3 wsBench.py [--calls 50] [--rows 200] [--latency 0] [--error-rate 0] [--pysimplesoap] [--urllib]
+                    [--save-baseline bench.json] [--baseline bench.json] [--tolerance 0.25]
+
+Example: $ python3 wsBench.py --rows 2000 --save-baseline bench.json
+         $ python3 wsBench.py --rows 2000 --baseline bench.json
+'''
+import argparse
+import json
+import os
+import sys
+
+from wsEspolClient import Client, Metrics
+from wsEspolClient.FakeServer import FakeServer
+from wsEspolClient.Transport import PooledTransport, UrllibTransport
+
+
+CALLS = {
+    'ws_consultar_persona_nombres': ('John', 'Doe'),
+    'ws_consulta_calificaciones': ('2017', '1', '201300000'),
+    'ws_consulta_codigo_estudiante': ('jdoe',),
+    'ws_consulta_periodo_actual': (),
+    'ws_estudiantes_registrados': ('ICM00604', '1'),
+    'ws_horario_clases': ('ICM00604', '1'),
+    'ws_horario_examenes': ('ICM00604', '1'),
+    'ws_materias_registradas': ('201300000',),
+    'ws_info_estudiante_general': ('201300000',),
+    'ws_info_estudiante': ('201300000',),
+    'ws_info_estudiante_carrera': ('201300000',),
+    'ws_info_personal_estudiante': ('201300000', '0912345678'),
+    'ws_info_usuario': ('jdoe',),
+    'ws_info_paralelo': ('ICM00604', '1'),
+    'ws_materias_disponibles': ('201300000',),
+}
+
+# the phases of the Metrics traces; pysimplesoap builds, sends and receives in
+# one step, so its whole round-trip is reported as network
+PHASES = ('total', 'build', 'network', 'receive', 'parse', 'cleanup')
+
+
+def percentile(values, rank):
+    '''
+    :param values: sorted list of numbers
+    :param rank: percentile between 0 and 100
+    '''
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(rank / 100.0 * (len(values) - 1))))]
+
+
+def summary(samples):
+    samples = sorted(samples)
+    return {'p50': percentile(samples, 50), 'p90': percentile(samples, 90),
+            'p99': percentile(samples, 99), 'max': samples[-1] if samples else 0.0}
+
+
+def bench_method(client, traces, method, args, calls):
+    '''
+    Time the phases of the calls of a method with the traces of the client
+    :param traces: list that the Metrics hook fills with the finished traces
+    :return: dict phase -> list of seconds, rows parsed, seconds parsing, errors
+    '''
+    timings = {phase: [] for phase in PHASES}
+    errors = 0
+    rows = 0
+    parse_time = 0.0
+    del traces[:]
+    for _ in range(calls):
+        try:
+            getattr(client, method)(*args)
+        except Exception:
+            pass
+    for trace in traces:
+        if trace.error:
+            errors += 1
+            continue
+        for phase in PHASES:
+            timings[phase].append(trace.phases.get(phase, 0.0))
+        rows += trace.rows
+        parse_time += trace.phases.get('parse', 0.0)
+    return timings, rows, parse_time, errors
+
+
+def run(args):
+    results = {}
+    traces = []
+    metrics = Metrics()
+    metrics.add_hook(traces.append)
+    with FakeServer(rows=args.rows, latency=args.latency, error_rate=args.error_rate,
+                    seed=0) as server:
+        transport = UrllibTransport() if args.urllib else PooledTransport()
+        client = Client(location=server.location, precompiled=not args.pysimplesoap,
+                        transport=transport, metrics=metrics)
+        for method, method_args in sorted(CALLS.items()):
+            timings, rows, parse_time, errors = bench_method(client, traces, method, method_args,
+                                                             args.calls)
+            results[method] = {
+                'phases': {phase: summary(values) for phase, values in timings.items()},
+                'rows_per_second': rows / parse_time if parse_time else 0.0,
+                'errors': errors,
+            }
+    return results
+
+
+def report(results):
+    print('{:32} {:>8} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10} {:>12}'.format(
+        'METHOD (p50 ms)', 'ERRORS', 'TOTAL', 'BUILD', 'NETWORK', 'RECEIVE', 'PARSE',
+        'CLEANUP', 'ROWS/S'))
+    for method, result in sorted(results.items()):
+        phases = result['phases']
+        milliseconds = [phases[phase]['p50'] * 1000 for phase in PHASES]
+        print('{:32} {:>8} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f} '
+              '{:>12.0f}'.format(method, result['errors'], *milliseconds,
+                                 result['rows_per_second']))
+
+
+def regressions(results, baseline, tolerance):
+    '''
+    Compare the p50 of every phase against a baseline
+    :return: list of strings with the regressions
+    '''
+    found = []
+    for method, result in sorted(results.items()):
+        for phase in PHASES:
+            # a baseline of another version may not have every phase
+            before = baseline.get(method, {}).get('phases', {}).get(phase, {}).get('p50')
+            now = result['phases'][phase]['p50']
+            if before and now > before * (1 + tolerance):
+                found.append('{} {}: {:.3f}ms -> {:.3f}ms'.format(
+                    method, phase, before * 1000, now * 1000))
+    return found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark Client against a fake server')
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--pysimplesoap', action='store_true',
+                        help='measure the pysimplesoap requests instead of the precompiled ones')
+    parser.add_argument('--urllib', action='store_true',
+                        help='send the precompiled envelopes with urllib instead of the '
+                             'pooled keep-alive transport')
+    parser.add_argument('--save-baseline')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    os.environ.setdefault('SPIDER_USER', 'bench')
+    os.environ.setdefault('SPIDER_KEY', 'bench')
+
+    results = run(args)
+    report(results)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            found = regressions(results, json.load(baseline), args.tolerance)
+        for line in found:
+            print('REGRESSION ' + line)
+        if found:
+            sys.exit(1)
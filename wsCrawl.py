@@ -0,0 +1,58 @@
+'''
+wsCrawl gets the roster of some courses, the general info of every student
+and their grades of each term on several worker processes
+:argv: course codes with its parallel, years and terms
+
+$python3 wsCrawl.py <course:parallel>... --years <first> <last> [--terms 1 2]
+                    [--db ~/.wsSp1d3r/crawl.sqlite3] [--processes <cores>] [--rate 20]
+                    [--grades grades.jsonl] [--info info.jsonl] [--retry-failed]
+
+Example: $ python3 wsCrawl.py ICM00604:1 ICM00604:2 --years 2015 2017 --grades grades.jsonl
+Run it again with the same --db to resume an interrupted crawl, --grades writes
+a wsHarvester checkpoint that wsStats and wsExport read.
+'''
+import argparse
+import sys
+
+from wsEspolClient.Crawl import DEFAULT_PATH, CrawlCoordinator
+from wsEspolClient.GradeHarvester import periods
+from wsHarvester import parse_course
+
+
+def export(coordinator, kind, path):
+    with open(path, 'w', encoding='utf-8') as output:
+        written = coordinator.export(kind, output)
+    print("{} {} results written to {}".format(written, kind, path))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Crawl the students of some courses')
+    parser.add_argument('courses', nargs='+', type=parse_course)
+    parser.add_argument('--years', nargs=2, required=True, metavar=('FIRST', 'LAST'))
+    parser.add_argument('--terms', nargs='+', default=['1', '2'])
+    parser.add_argument('--db', default=DEFAULT_PATH)
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--rate', type=float, default=20.0,
+                        help='calls per second of all the workers together')
+    parser.add_argument('--lease-timeout', type=float, default=120.0)
+    parser.add_argument('--grades', help='json lines file for the grades')
+    parser.add_argument('--info', help='json lines file for the general info of the students')
+    parser.add_argument('--retry-failed', action='store_true')
+    args = parser.parse_args()
+
+    coordinator = CrawlCoordinator(args.db, args.processes, args.rate,
+                                   lease_timeout=args.lease_timeout)
+    if args.retry_failed:
+        print("{} failed units queued again".format(coordinator.queue.retry_failed()))
+    try:
+        counts = coordinator.run(args.courses, periods(*args.years, terms=args.terms))
+    except KeyboardInterrupt:
+        print("Interrupted, run it again to resume :)")
+        sys.exit(1)
+    if args.grades:
+        export(coordinator, 'grades', args.grades)
+    if args.info:
+        export(coordinator, 'info', args.info)
+    coordinator.close()
+    if counts['failed']:
+        print("{} units failed, run it again with --retry-failed".format(counts['failed']))
@@ -0,0 +1,40 @@
+'''
+wsDaemon keeps a warm Client, its connections, the response cache and the
+people index behind a local Unix socket; wsSpider uses it when it runs
+:argv: options of the daemon
+
+$python3 wsDaemon.py [--socket ~/.wsSp1d3r/daemon.sock] [--stop]
+
+Example: $ python3 wsDaemon.py &
+         $ python3 wsSpider.py John Doe 2017 1
+         $ python3 wsDaemon.py --stop
+'''
+import argparse
+import signal
+import sys
+
+from wsEspolClient.Daemon import DEFAULT_SOCKET, Daemon, DaemonClient
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve Espol Web Services on a Unix socket')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET)
+    parser.add_argument('--stop', action='store_true', help='stop the running daemon')
+    args = parser.parse_args()
+
+    if args.stop:
+        client = DaemonClient.connect(args.socket)
+        if client is None:
+            print("There is no daemon running on {}".format(args.socket))
+            sys.exit(1)
+        client.shutdown()
+        sys.exit(0)
+
+    daemon = Daemon(args.socket)
+    # SIGTERM stops it as cleanly as ctrl-c
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print("Listening on {}".format(args.socket))
+    try:
+        daemon.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
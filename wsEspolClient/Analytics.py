@@ -0,0 +1,471 @@
+'''
+Columnar analytics of harvested grades: pass rates, averages, attempt
+distributions and trends grouped by course, term, parallel and state
+'''
+import json
+from collections import namedtuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# bits of the code of each dimension inside the packed group key
+DIMENSIONS = {'course': 20, 'student': 24, 'year': 12, 'term': 4, 'parallel': 8, 'estado': 6}
+CATEGORICAL = ('course', 'student', 'term', 'estado')
+FIRST_YEAR = 1900
+VALUE_BITS = 16
+# the fields whose values fit in the low VALUE_BITS of a distribution key
+DISTRIBUTIONS = ('VEZ',) + tuple(dimension for dimension, bits in DIMENSIONS.items()
+                                 if bits <= VALUE_BITS)
+
+PASSED = ('AP',)
+
+METRICS = ('count', 'passed', 'pass_rate', 'average', 'std', 'minimum', 'maximum', 'attempts')
+
+CHUNK_SIZE = 65536
+
+
+class GrowingArray():
+    '''
+    GrowingArray is a numpy array that doubles its capacity when it is full,
+    so appending is amortized constant time
+    '''
+
+    def __init__(self, dtype, capacity=1024):
+        self.size = 0
+        self.__data = numpy.empty(capacity, dtype=dtype)
+
+    def extend(self, values):
+        values = numpy.asarray(values, dtype=self.__data.dtype)
+        end = self.size + len(values)
+        if end > len(self.__data):
+            data = numpy.empty(max(end, 2 * len(self.__data)), dtype=self.__data.dtype)
+            data[:self.size] = self.__data[:self.size]
+            self.__data = data
+        self.__data[self.size:end] = values
+        self.size = end
+
+    @property
+    def values(self):
+        '''
+        :return: view of the values, it is not copied
+        '''
+        return self.__data[:self.size]
+
+
+class Categories():
+    '''
+    Categories encodes strings as consecutive integer codes, code 0 is None
+    '''
+
+    def __init__(self):
+        self.values = [None]
+        self.__codes = {None: 0}
+
+    def code(self, value):
+        code = self.__codes.get(value)
+        if code is None:
+            code = self.__codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def encode(self, values):
+        '''
+        :param values: list of strings
+        :return: list of codes
+        '''
+        codes = list(map(self.__codes.get, values))
+        if None in codes:
+            codes = [self.code(value) if code is None else code
+                     for value, code in zip(values, codes)]
+        return codes
+
+    def find(self, value):
+        '''
+        :return: code of a value or None if it was never seen
+        '''
+        return self.__codes.get(value)
+
+
+class _Aggregate():
+    '''
+    Running sums per group, only the rows appended since the last refresh
+    are added to them
+    '''
+
+    def __init__(self):
+        self.rows = 0
+        self.keys = numpy.empty(0, dtype=numpy.int64)
+        self.sums = {name: numpy.empty(0) for name in
+                     ('count', 'passed', 'graded', 'total', 'squares', 'attempts', 'tried')}
+        self.minimum = numpy.empty(0)
+        self.maximum = numpy.empty(0)
+
+    def add(self, keys, passed, average, attempts):
+        '''
+        :param keys: packed group key of each new row
+        :param passed: bool array
+        :param average: PROMEDIO of each row, nan when unknown
+        :param attempts: VEZ of each row, 0 when unknown
+        '''
+        new_keys, inverse = numpy.unique(keys, return_inverse=True)
+        merged = numpy.union1d(self.keys, new_keys)
+        old = numpy.searchsorted(merged, self.keys)
+        new = numpy.searchsorted(merged, new_keys)[inverse]
+        size = len(merged)
+        graded = ~numpy.isnan(average)
+        values = numpy.where(graded, average, 0.0)
+        tried = attempts > 0
+        added = {
+            'count': numpy.bincount(new, minlength=size),
+            'passed': numpy.bincount(new, weights=passed, minlength=size),
+            'graded': numpy.bincount(new, weights=graded, minlength=size),
+            'total': numpy.bincount(new, weights=values, minlength=size),
+            'squares': numpy.bincount(new, weights=values * values, minlength=size),
+            'attempts': numpy.bincount(new, weights=attempts, minlength=size),
+            'tried': numpy.bincount(new, weights=tried, minlength=size),
+        }
+        for name, sums in self.sums.items():
+            merged_sums = added[name].astype(numpy.float64)
+            merged_sums[old] += sums
+            self.sums[name] = merged_sums
+        minimum = numpy.full(size, numpy.inf)
+        maximum = numpy.full(size, -numpy.inf)
+        minimum[old] = self.minimum
+        maximum[old] = self.maximum
+        numpy.minimum.at(minimum, new[graded], average[graded])
+        numpy.maximum.at(maximum, new[graded], average[graded])
+        self.keys, self.minimum, self.maximum = merged, minimum, maximum
+
+
+class GradeAnalytics():
+    '''
+    GradeAnalytics keeps grade rows in array-backed columns: the course,
+    student, term and state are dictionary encoded, the grades are floats
+    (nan when missing) and VEZ an integer (0 when missing).
+
+    Grouped aggregates are computed with numpy over packed group keys and
+    kept as running sums, so asking again after appending rows only
+    processes the new ones.
+    '''
+
+    def __init__(self, passed=PASSED):
+        '''
+        :param passed: values of ESTADO that count as passed
+        '''
+        if numpy is None:
+            raise ImportError('numpy is required for the grade analytics')
+        self.passed = tuple(passed)
+        self.categories = {dimension: Categories() for dimension in CATEGORICAL}
+        self.__codes = {dimension: GrowingArray(numpy.int32) for dimension in DIMENSIONS}
+        self.__grades = {field: GrowingArray(numpy.float64)
+                         for field in ('NOTA1', 'NOTA2', 'NOTA3', 'PROMEDIO')}
+        self.__attempts = GrowingArray(numpy.int16)
+        self.__aggregates = {}
+
+    def __len__(self):
+        return self.__attempts.size
+
+    def extend(self, rows):
+        '''
+        Append grade rows
+        :param rows: iterable of dicts with student, year, term, the Grade fields
+        and optionally course and parallel (course defaults to MATERIA), e.g.
+        the rows of Export.grade_rows or Export.checkpoint_rows
+        :return: number of rows appended
+        '''
+        count = 0
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= CHUNK_SIZE:
+                count += self.__append(chunk)
+                chunk = []
+        if chunk:
+            count += self.__append(chunk)
+        return count
+
+    def add_grades(self, student, year, term, grades, course=None, parallel=None):
+        '''
+        Append the Grade records of ws_consulta_calificaciones
+        :return: number of rows appended
+        '''
+        return self.extend(dict(grade._asdict(), student=student, year=year, term=term,
+                                course=course, parallel=parallel) for grade in grades)
+
+    @classmethod
+    def from_checkpoint(cls, path, **kwargs):
+        '''
+        Load the grades harvested by GradeHarvester
+        :param path: checkpoint json lines file
+        '''
+        from .Export import checkpoint_rows
+
+        analytics = cls(**kwargs)
+        analytics.extend(checkpoint_rows(path))
+        return analytics
+
+    def extend_table(self, table):
+        '''
+        Append the rows of a pyarrow Table with the columns of the grades
+        schema of Export, encoding whole columns at once
+        :return: number of rows appended
+        '''
+        import pyarrow
+        import pyarrow.compute
+
+        names = table.column_names
+        size = table.num_rows
+
+        def column(*candidates):
+            for name in candidates:
+                if name in names:
+                    return table.column(name)
+            return pyarrow.chunked_array([pyarrow.nulls(size)])
+
+        def categorical(values):
+            encoded = pyarrow.compute.dictionary_encode(
+                values.cast(pyarrow.string())).combine_chunks()
+            dictionary = encoded.dictionary.to_pylist()
+            # nulls point past the dictionary, to the code of None
+            indices = pyarrow.compute.fill_null(encoded.indices, len(dictionary))
+            return dictionary, indices.to_numpy()
+
+        def numbers(values, missing):
+            values = pyarrow.compute.fill_null(values.cast(pyarrow.float64()), missing)
+            return values.to_numpy()
+
+        codes = {}
+        for dimension, values in (
+                ('course', pyarrow.compute.coalesce(column('course').cast(pyarrow.string()),
+                                                    column('MATERIA').cast(pyarrow.string()))),
+                ('student', column('student')), ('term', column('term')),
+                ('estado', column('ESTADO'))):
+            dictionary, indices = categorical(values)
+            mapping = numpy.array(self.categories[dimension].encode(dictionary) + [0],
+                                  dtype=numpy.int64)
+            codes[dimension] = mapping[indices]
+        codes['year'] = numbers(column('year'), FIRST_YEAR) - FIRST_YEAR
+        codes['parallel'] = numbers(column('parallel', 'PARALELO'), 0)
+        self.__store(codes, {field: numbers(column(field), numpy.nan) for field in self.__grades},
+                     numbers(column('VEZ'), 0))
+        return size
+
+    @classmethod
+    def from_parquet(cls, path, **kwargs):
+        '''
+        Load a grades file written by wsExport, needs pyarrow
+        :param path: parquet file
+        '''
+        import pyarrow.parquet
+
+        analytics = cls(**kwargs)
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches():
+            analytics.extend_table(pyarrow.Table.from_batches([batch]))
+        return analytics
+
+    def __append(self, rows):
+        categories = self.categories
+        codes = {
+            'course': categories['course'].encode([row.get('course') or row.get('MATERIA')
+                                                   for row in rows]),
+            'student': categories['student'].encode([row.get('student') for row in rows]),
+            'term': categories['term'].encode([str(row.get('term')) for row in rows]),
+            'estado': categories['estado'].encode([row.get('ESTADO') for row in rows]),
+            'year': [int(row.get('year') or FIRST_YEAR) - FIRST_YEAR for row in rows],
+            'parallel': [int(row.get('parallel') or row.get('PARALELO') or 0) for row in rows],
+        }
+        grades = {field: [numpy.nan if row.get(field) is None else row.get(field)
+                          for row in rows] for field in self.__grades}
+        self.__store(codes, grades, [row.get('VEZ') or 0 for row in rows])
+        return len(rows)
+
+    def __store(self, codes, grades, attempts):
+        '''
+        Append the columns of some rows, nothing is appended when a code does
+        not fit in the bits of its dimension in the packed group keys
+        '''
+        codes = {dimension: numpy.asarray(values, dtype=numpy.int64)
+                 for dimension, values in codes.items()}
+        attempts = numpy.asarray(attempts, dtype=numpy.int64)
+        for dimension, values in codes.items():
+            self.__check(dimension, values, DIMENSIONS[dimension])
+        self.__check('VEZ', attempts, VALUE_BITS - 1)
+        for dimension, values in codes.items():
+            self.__codes[dimension].extend(values)
+        for field, values in grades.items():
+            self.__grades[field].extend(values)
+        self.__attempts.extend(attempts)
+
+    def __check(self, dimension, values, bits):
+        if not len(values):
+            return
+        low, high = int(values.min()), int(values.max())
+        if low < 0 or high >= 1 << bits:
+            if dimension in self.categories:
+                raise ValueError('more than {} values of {}'.format((1 << bits) - 1, dimension))
+            if dimension == 'year':
+                low, high = low + FIRST_YEAR, high + FIRST_YEAR
+                bits_range = (FIRST_YEAR, FIRST_YEAR + (1 << bits) - 1)
+            else:
+                bits_range = (0, (1 << bits) - 1)
+            raise ValueError('{} out of range {}..{}: {}..{}'.format(
+                dimension, bits_range[0], bits_range[1], low, high))
+
+    def column(self, name):
+        '''
+        :param name: a dimension (codes), a grade field or 'VEZ'
+        :return: numpy array view of the column
+        '''
+        if name in self.__codes:
+            return self.__codes[name].values
+        if name == 'VEZ':
+            return self.__attempts.values
+        return self.__grades[name].values
+
+    def __keys(self, by, start=0):
+        if sum(DIMENSIONS[dimension] for dimension in by) > 63:
+            raise AttributeError('too many dimensions to group by at once: {}'.format(by))
+        keys = numpy.zeros(len(self) - start, dtype=numpy.int64)
+        for dimension in by:
+            keys <<= DIMENSIONS[dimension]
+            keys |= self.__codes[dimension].values[start:]
+        return keys
+
+    def __mask(self, where, start=0):
+        '''
+        :return: bool array of the rows since start that match where, None for all
+        '''
+        mask = None
+        for dimension, value in (where or {}).items():
+            if dimension in self.categories:
+                code = self.categories[dimension].find(str(value) if dimension == 'term'
+                                                       else value)
+                code = -1 if code is None else code
+            elif dimension == 'year':
+                code = int(value) - FIRST_YEAR
+            else:
+                code = int(value)
+            matches = self.__codes[dimension].values[start:] == code
+            mask = matches if mask is None else mask & matches
+        return mask
+
+    def __decode(self, by, key):
+        values = []
+        for dimension in reversed(by):
+            bits = DIMENSIONS[dimension]
+            code = int(key) & ((1 << bits) - 1)
+            key = int(key) >> bits
+            if dimension in self.categories:
+                values.append(self.categories[dimension].values[code])
+            elif dimension == 'year':
+                values.append(code + FIRST_YEAR)
+            else:
+                values.append(code or None)
+        return tuple(reversed(values))
+
+    def __refresh(self, by, where):
+        '''
+        Bring the running sums of a grouping up to date with the new rows
+        '''
+        cache_key = (by, json.dumps(where or {}, sort_keys=True, default=str))
+        aggregate = self.__aggregates.get(cache_key)
+        if aggregate is None:
+            aggregate = self.__aggregates[cache_key] = _Aggregate()
+        start = aggregate.rows
+        if start < len(self):
+            keys = self.__keys(by, start)
+            passed_codes = [self.categories['estado'].find(value) for value in self.passed]
+            passed = numpy.isin(self.__codes['estado'].values[start:],
+                                [code for code in passed_codes if code is not None])
+            average = self.__grades['PROMEDIO'].values[start:]
+            attempts = self.__attempts.values[start:]
+            mask = self.__mask(where, start)
+            if mask is not None:
+                keys, passed, average, attempts = keys[mask], passed[mask], average[mask], \
+                    attempts[mask]
+            aggregate.add(keys, passed, average, attempts)
+            aggregate.rows = len(self)
+        return aggregate
+
+    def aggregate(self, by=('course',), where=None):
+        '''
+        Group the rows and compute count, passed, pass_rate, average (mean of
+        PROMEDIO), std, minimum and maximum of PROMEDIO and attempts (mean VEZ)
+        :param by: tuple of dimensions: course, student, year, term, parallel, estado
+        :param where: dict dimension -> value that filters the rows
+        :return: list of namedtuples with the dimensions and the metrics, sorted by group
+        '''
+        by = tuple(by)
+        unknown = [dimension for dimension in by + tuple(where or ()) if dimension not in DIMENSIONS]
+        if unknown:
+            raise AttributeError('unknown dimensions {}'.format(', '.join(unknown)))
+        aggregate = self.__refresh(by, where)
+        sums = aggregate.sums
+        count = sums['count']
+        graded = sums['graded']
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            average = sums['total'] / graded
+            std = numpy.sqrt(numpy.maximum(sums['squares'] / graded - average * average, 0.0))
+            pass_rate = sums['passed'] / count
+            attempts = sums['attempts'] / sums['tried']
+        minimum = numpy.where(graded > 0, aggregate.minimum, numpy.nan)
+        maximum = numpy.where(graded > 0, aggregate.maximum, numpy.nan)
+        Group = namedtuple('Group', by + METRICS)
+        groups = []
+        for position, key in enumerate(aggregate.keys):
+            metrics = (int(count[position]), int(sums['passed'][position]),
+                       float(pass_rate[position]), _number(average[position]),
+                       _number(std[position]), _number(minimum[position]),
+                       _number(maximum[position]), _number(attempts[position]))
+            groups.append(Group(*self.__decode(by, key) + metrics))
+        # None goes last and is never compared with the values
+        groups.sort(key=lambda group: tuple((value is None, value)
+                                            for value in group[:len(by)]))
+        return groups
+
+    def distribution(self, field='VEZ', by=('course',), where=None):
+        '''
+        Count the rows of each value of an integer column per group
+        :param field: one of DISTRIBUTIONS, 'VEZ' or a small dimension e.g. 'estado'
+        :return: dict group tuple -> dict value -> count
+        '''
+        by = tuple(by)
+        if field not in DISTRIBUTIONS:
+            raise AttributeError('field must be one of {}'.format(', '.join(DISTRIBUTIONS)))
+        unknown = [dimension for dimension in by + tuple(where or ())
+                   if dimension not in DIMENSIONS]
+        if unknown:
+            raise AttributeError('unknown dimensions {}'.format(', '.join(unknown)))
+        if sum(DIMENSIONS[dimension] for dimension in by) > 63 - VALUE_BITS:
+            raise AttributeError('too many dimensions to group by at once: {}'.format(by))
+        # the value goes in the low bits of the group key, one sort counts everything
+        keys = self.__keys(by) << VALUE_BITS | self.column(field).astype(numpy.int64)
+        mask = self.__mask(where)
+        if mask is not None:
+            keys = keys[mask]
+        pairs, counts = numpy.unique(keys, return_counts=True)
+        result = {}
+        for pair, count in zip(pairs.tolist(), counts.tolist()):
+            value = pair & ((1 << VALUE_BITS) - 1)
+            if field in self.categories:
+                value = self.categories[field].values[value]
+            elif field == 'year':
+                value += FIRST_YEAR
+            elif field == 'parallel':
+                value = value or None
+            result.setdefault(self.__decode(by, pair >> VALUE_BITS), {})[value] = count
+        return result
+
+    def trend(self, where=None):
+        '''
+        Aggregates per academic term in chronological order
+        :param where: dict dimension -> value e.g. {'course': 'FISICA I'}
+        '''
+        return self.aggregate(('year', 'term'), where)
+
+
+def _number(value):
+    return None if numpy.isnan(value) else float(value)
@@ -0,0 +1,100 @@
+'''
+Asyncio client to consume Espol Web Services concurrently
+'''
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from .Client import Client
+from .Pool import ThreadLocalClient
+from .Transport import PooledTransport
+
+
+def _coroutine(name):
+    '''
+    Build the coroutine counterpart of a Client ws_* method
+    :param name: name of the method e.g. 'ws_consulta_calificaciones'
+    :return: coroutine function with the same signature
+    '''
+    @functools.wraps(getattr(Client, name))
+    async def method(self, *args, **kwargs):
+        return await self.call(name, *args, **kwargs)
+    return method
+
+
+class AsyncClient():
+    '''
+    AsyncClient exposes every ws_* method of Client as a coroutine.
+    The SOAP round-trips run on a bounded pool of worker threads, each one
+    with its own Client (and GTSIAuthSoapHeader). The clients share one
+    PooledTransport, so the connections are kept open and reused by every
+    call running on the pool.
+    '''
+
+    def __init__(self, concurrency=8, client_factory=None, transport=None):
+        '''
+        :param concurrency: max number of calls running at the same time
+        :param client_factory: callable that returns a new Client, by default a
+        Client over the shared transport
+        :param transport: transport shared by the default clients, by default a
+        PooledTransport with concurrency connections
+        '''
+        self.concurrency = concurrency
+        self.__own_transport = transport is None and client_factory is None
+        self.transport = transport or PooledTransport(max_connections=concurrency)
+        self.__client = ThreadLocalClient(client_factory or functools.partial(
+            Client, transport=self.transport))
+        self.__executor = ThreadPoolExecutor(max_workers=concurrency,
+                                             thread_name_prefix='wsEspol')
+
+    def __run(self, name, args, kwargs):
+        return getattr(self.__client(), name)(*args, **kwargs)
+
+    async def call(self, name, *args, **kwargs):
+        '''
+        Run a Client method on the pool
+        :param name: name of the method e.g. 'ws_info_estudiante'
+        :return: the result of the method
+        '''
+        if not name.startswith('ws_') or not hasattr(Client, name):
+            raise AttributeError('unknown method {}'.format(name))
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor,
+                                          functools.partial(self.__run, name, args, kwargs))
+
+    async def gather(self, calls, limit=None, return_exceptions=False):
+        '''
+        Run a batch of calls concurrently
+        :param calls: iterable of tuples (method name, *args)
+        e.g. [('ws_info_estudiante', '201300000'), ('ws_consulta_periodo_actual',)]
+        :param limit: max calls in flight, by default the pool concurrency
+        :param return_exceptions: return the exceptions instead of raising the first one
+        :return: list with the results in the same order of the calls
+        '''
+        semaphore = asyncio.Semaphore(limit or self.concurrency)
+
+        async def bounded(name, *args):
+            async with semaphore:
+                return await self.call(name, *args)
+
+        return await asyncio.gather(*(bounded(*call) for call in calls),
+                                    return_exceptions=return_exceptions)
+
+    def close(self):
+        '''
+        Wait for the running calls and release the worker threads
+        '''
+        self.__executor.shutdown(wait=True)
+        if self.__own_transport:
+            self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+for _name in dir(Client):
+    if _name.startswith('ws_'):
+        setattr(AsyncClient, _name, _coroutine(_name))
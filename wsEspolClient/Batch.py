@@ -0,0 +1,186 @@
+'''
+Batch lookups of grades: many queries resolved concurrently, with a
+deterministic choice when a name matches several people
+'''
+import csv
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .Daemon import error_name
+from .Endpoints import ENDPOINTS
+from .Export import Column, endpoint_columns, writer
+from .Pool import ThreadLocalClient, bounded
+
+
+Query = namedtuple('Query', 'line name lastname code year term')
+
+# status is ok, ambiguous, not_found, invalid or error
+Result = namedtuple('Result', 'query status student grades error')
+
+# skip: report ambiguous names, first: the lowest student code, all: every person
+POLICIES = ('skip', 'first', 'all')
+
+RESULT_COLUMNS = (Column('line', 'int64'), Column('status', 'string'),
+                  Column('student', 'string'), Column('name', 'string'),
+                  Column('year', 'string'), Column('term', 'string'), Column('error', 'string'))
+GRADE_COLUMNS = endpoint_columns('ws_consulta_calificaciones')
+
+Person = ENDPOINTS['ws_consultar_persona_nombres'].record_type()
+
+
+def parse_query(line, fields):
+    '''
+    :param line: number of the line
+    :param fields: list of strings, name,lastname,year,term or code,year,term
+    :return: Query
+    '''
+    fields = [field.strip() for field in fields]
+    if len(fields) == 3 and fields[0].isdigit():
+        return Query(line, None, None, fields[0], fields[1], fields[2])
+    if len(fields) == 4 and all(fields):
+        return Query(line, fields[0], fields[1], None, fields[2], fields[3])
+    raise ValueError('expected name,lastname,year,term or code,year,term')
+
+
+def choose(people, policy):
+    '''
+    Apply the disambiguation policy
+    :param people: list of Person records
+    :param policy: one of POLICIES
+    :return: list of the people to look up, empty if an ambiguous name is skipped
+    '''
+    if len(people) <= 1 or policy == 'all':
+        return list(people)
+    if policy == 'first':
+        return [min(people, key=lambda person: person.CODESTUDIANTE or '')]
+    return []
+
+
+class BatchRunner():
+    '''
+    BatchRunner reads queries lazily and keeps a bounded window of them in
+    flight, so memory does not depend on the size of the batch. Results are
+    yielded as soon as they are ready, not in the order of the input.
+    '''
+
+    def __init__(self, client_factory, search=None, workers=8, policy='skip'):
+        '''
+        :param client_factory: callable that returns the client of each thread,
+        e.g. Client or DaemonClient
+        :param search: callable (client, name, lastname) -> list of Person records,
+        by default client.ws_consultar_persona_nombres
+        :param workers: number of queries resolved at the same time
+        :param policy: one of POLICIES
+        '''
+        if policy not in POLICIES:
+            raise AttributeError('policy must be one of {}'.format(', '.join(POLICIES)))
+        self.workers = workers
+        self.policy = policy
+        self.__client = ThreadLocalClient(client_factory)
+        self.__search = search or (lambda client, name, lastname:
+                                   client.ws_consultar_persona_nombres(name, lastname))
+
+    def resolve(self, query):
+        '''
+        Find the student of a query and get the grades
+        :return: list of Result, one per student looked up
+        '''
+        client = self.__client()
+        try:
+            if query.code:
+                people = [Person(CODESTUDIANTE=query.code)]
+            else:
+                people = self.__search(client, query.name, query.lastname)
+            if not people:
+                return [Result(query, 'not_found', None, [], None)]
+            chosen = choose(people, self.policy)
+            if not chosen:
+                codes = ', '.join(sorted(person.CODESTUDIANTE or '?' for person in people))
+                return [Result(query, 'ambiguous', None, [],
+                               '{} people match: {}'.format(len(people), codes))]
+            return [Result(query, 'ok', person,
+                           client.ws_consulta_calificaciones(query.year, query.term,
+                                                             person.CODESTUDIANTE), None)
+                    for person in chosen]
+        except Exception as error:
+            return [Result(query, 'error', None, [],
+                           '{}: {}'.format(error_name(error), error))]
+
+    def __results(self, query):
+        # the invalid lines come as a Result already
+        if isinstance(query, Result):
+            return [query]
+        return self.resolve(query)
+
+    def queries(self, lines):
+        '''
+        :param lines: iterable of csv lines
+        :return: generator of Query, or of Result for the invalid lines
+        '''
+        for number, fields in enumerate(csv.reader(lines), 1):
+            if not fields or not ''.join(fields).strip() or fields[0].startswith('#'):
+                continue
+            try:
+                yield parse_query(number, fields)
+            except ValueError as error:
+                yield Result(Query(number, ','.join(fields), None, None, None, None),
+                             'invalid', None, [], str(error))
+
+    def run(self, lines):
+        '''
+        Resolve the queries of a batch
+        :param lines: iterable of lines e.g. an open file or sys.stdin
+        :return: generator of Result
+        '''
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for _, future in bounded(executor, self.__results, self.queries(lines),
+                                     self.workers * 4):
+                yield from future.result()
+
+
+def result_rows(result):
+    '''
+    :return: generator of flat rows, one per grade or one for a result without grades
+    '''
+    query = result.query
+    student = result.student
+    if student:
+        code, names = student.CODESTUDIANTE, (student.NOMBRES, student.APELLIDOS)
+    else:
+        code, names = query.code, (query.name, query.lastname)
+    row = {'line': query.line, 'status': result.status, 'student': code,
+           'name': ' '.join(filter(None, names)) or None, 'year': query.year,
+           'term': query.term, 'error': result.error}
+    if not result.grades:
+        yield row
+    for grade in result.grades:
+        yield dict(row, **grade._asdict())
+
+
+class ResultWriter():
+    '''
+    ResultWriter streams results as json lines (one object per result with
+    its grades) or csv (one line per grade) and flushes every result
+    '''
+
+    def __init__(self, stream, fmt):
+        '''
+        :param stream: open text stream e.g. sys.stdout
+        :param fmt: 'jsonl' or 'csv'
+        '''
+        self.nested = fmt == 'jsonl'
+        schema = RESULT_COLUMNS + ((Column('grades', 'list'),) if self.nested else GRADE_COLUMNS)
+        self.__writer = writer(stream, schema, fmt)
+
+    def write(self, result):
+        if self.nested:
+            row = next(result_rows(result._replace(grades=[])))
+            row['grades'] = [grade._asdict() for grade in result.grades]
+            self.__writer.write(row)
+        else:
+            for row in result_rows(result):
+                self.__writer.write(row)
+        self.__writer.flush()
+
+    def close(self):
+        self.__writer.close()
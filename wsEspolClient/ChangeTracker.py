@@ -0,0 +1,182 @@
+'''
+Incremental detection of the grade changes between polls
+'''
+import json
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+
+from .Client import Client
+from .Pool import ThreadLocalClient, bounded
+
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.wsSp1d3r', 'changes.sqlite3')
+
+TRACKED_FIELDS = ('MATERIA', 'NOTA1', 'NOTA2', 'NOTA3', 'PROMEDIO', 'ESTADO')
+DIGEST_SIZE = 16
+
+YEAR_FIELDS = ('ANIO', 'ANO', 'ANIOLECTIVO', 'YEAR')
+TERM_FIELDS = ('TERMINO', 'TERM', 'PERIODO')
+
+# old is None for a course that appears, new is None for one that disappears
+Change = namedtuple('Change', 'student year term course field old new')
+
+
+def digest(data):
+    return blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+
+def current_period(client):
+    '''
+    Ask the web service for the current academic term
+    :return: tuple (year, term) of strings
+    '''
+    for record in client.ws_consulta_periodo_actual():
+        fields = record._asdict()
+        year = next((fields[name] for name in YEAR_FIELDS if fields.get(name)), None)
+        term = next((fields[name] for name in TERM_FIELDS if fields.get(name)), None)
+        if year and term:
+            return str(year).strip(), str(term).strip()
+    raise ValueError('wsConsultaPeriodoActual did not return the current term')
+
+
+class ChangeTracker():
+    '''
+    ChangeTracker keeps in SQLite a content hash of every (student, year,
+    term) and of each of its courses with the values of the tracked fields.
+
+    An update whose hash did not change costs one lookup and no writes; when
+    it changed, only the courses whose hash differs are compared field by
+    field and written back.
+    '''
+
+    def __init__(self, path=DEFAULT_PATH, fields=TRACKED_FIELDS):
+        '''
+        :param path: sqlite file, ':memory:' keeps the hashes in memory
+        :param fields: fields of the grades that are tracked, the first one names the course
+        '''
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.fields = tuple(fields)
+        self.checked = 0
+        self.changed = 0
+        self.failed = 0
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        self.__db.execute('CREATE TABLE IF NOT EXISTS units ('
+                          'student TEXT, year TEXT, term TEXT, digest BLOB, '
+                          'PRIMARY KEY (student, year, term))')
+        self.__db.execute('CREATE TABLE IF NOT EXISTS courses ('
+                          'student TEXT, year TEXT, term TEXT, course TEXT, digest BLOB, '
+                          'value TEXT, PRIMARY KEY (student, year, term, course))')
+
+    def rows(self, grades):
+        '''
+        :param grades: Grade records or dicts
+        :return: dict course -> list with the values of the tracked fields
+        '''
+        rows = {}
+        for grade in grades:
+            if not isinstance(grade, dict):
+                grade = grade._asdict()
+            values = [grade.get(field) for field in self.fields]
+            course = str(values[0])
+            # a course listed twice keeps both rows
+            key, repeated = course, 1
+            while key in rows:
+                repeated += 1
+                key = '{}#{}'.format(course, repeated)
+            rows[key] = values
+        return rows
+
+    def update(self, student, year, term, grades):
+        '''
+        Compare the grades of a term against the last ones seen and store them
+        :param grades: list of Grade records of ws_consulta_calificaciones
+        :return: list of Change, empty if nothing changed
+        '''
+        year, term = str(year), str(term)
+        encoded = {course: json.dumps(values, ensure_ascii=False, separators=(',', ':'))
+                   for course, values in self.rows(grades).items()}
+        digests = {course: digest(value.encode('utf-8')) for course, value in encoded.items()}
+        unit = digest(b''.join(course.encode('utf-8') + b'\0' + digests[course]
+                               for course in sorted(digests)))
+        key = (student, year, term)
+        with self.__lock:
+            self.checked += 1
+            row = self.__db.execute('SELECT digest FROM units WHERE student = ? AND year = ? '
+                                    'AND term = ?', key).fetchone()
+            if row is not None and row[0] == unit:
+                return []
+            stored = {course: (stored_digest, value) for course, stored_digest, value in
+                      self.__db.execute('SELECT course, digest, value FROM courses '
+                                        'WHERE student = ? AND year = ? AND term = ?', key)}
+            changes = []
+            empty = [None] * len(self.fields)
+            self.__db.execute('BEGIN')
+            try:
+                for course in sorted(set(stored) | set(digests)):
+                    if course in stored and stored[course][0] == digests.get(course):
+                        continue
+                    old = json.loads(stored[course][1]) if course in stored else empty
+                    new = json.loads(encoded[course]) if course in encoded else empty
+                    changes.extend(Change(student, year, term, course, field, before, after)
+                                   for field, before, after in zip(self.fields, old, new)
+                                   if before != after)
+                    if course in encoded:
+                        self.__db.execute('INSERT OR REPLACE INTO courses VALUES (?, ?, ?, ?, ?, ?)',
+                                          key + (course, digests[course], encoded[course]))
+                    else:
+                        self.__db.execute('DELETE FROM courses WHERE student = ? AND year = ? '
+                                          'AND term = ? AND course = ?', key + (course,))
+                self.__db.execute('INSERT OR REPLACE INTO units VALUES (?, ?, ?, ?)',
+                                  key + (unit,))
+                self.__db.execute('COMMIT')
+            except BaseException:
+                self.__db.execute('ROLLBACK')
+                raise
+            self.changed += 1
+        return changes
+
+    def poll(self, students, year=None, term=None, workers=8, client_factory=Client):
+        '''
+        Get the grades of many students and yield what changed
+        :param students: iterable of student ids
+        :param year: year to poll, by default the current term of the web service
+        :param term: term to poll
+        :param workers: number of concurrent calls
+        :param client_factory: callable that returns a new Client
+        :return: generator of Change; students that failed are counted in failed
+        '''
+        client = ThreadLocalClient(client_factory)
+        if year is None or term is None:
+            year, term = current_period(client())
+
+        def grades(student):
+            return student, client().ws_consulta_calificaciones(year, term, student)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for _, future in bounded(executor, grades, students, workers * 4):
+                if future.exception() is not None:
+                    self.failed += 1
+                    continue
+                student, records = future.result()
+                yield from self.update(student, year, term, records)
+
+    def stats(self):
+        '''
+        :return: dict with the units and courses stored and the updates checked,
+        changed and failed
+        '''
+        with self.__lock:
+            units = self.__db.execute('SELECT COUNT(*) FROM units').fetchone()[0]
+            courses = self.__db.execute('SELECT COUNT(*) FROM courses').fetchone()[0]
+        return {'units': units, 'courses': courses, 'checked': self.checked,
+                'changed': self.changed, 'failed': self.failed}
+
+    def close(self):
+        self.__db.close()
@@ -2,9 +2,12 @@
 Client to consume Espol Web Services
 '''
 import os
-from json import loads, dumps
 from pysimplesoap.client import SoapClient, SimpleXMLElement
-import xmltodict
+
+from .DiffgramParser import iter_rows
+from .Endpoints import ENDPOINTS
+from .Envelope import Envelope, soap_fault
+from .Transport import PooledTransport
 
 
 class Client():
@@ -12,96 +15,128 @@ class Client():
     Client class consume the wsEspol
     '''
 
+    LOCATION = 'https://ws.espol.edu.ec/saac/wsandroid.asmx'
+
     __service = None
     header = None
-    namespaces = {
-        'http://schemas.xmlsoap.org/soap/envelope/': None,
-        'http://tempuri.org/': None,
-        'http://www.w3.org/2001/XMLSchema': None
-    }
+    cache = None
 
-    def __init__(self):
-        self.__service = SoapClient(location='https://ws.espol.edu.ec/saac/wsandroid.asmx',
-                                    namespace='http://tempuri.org/', action='http://tempuri.org/')
+    def __init__(self, cache=None, location=LOCATION, precompiled=True, transport=None,
+                 metrics=None):
+        '''
+        :param cache: optional ResponseCache shared by the calls
+        :param location: url of the web service
+        :param precompiled: send precompiled envelopes instead of pysimplesoap requests
+        :param transport: transport of the precompiled envelopes, by default a PooledTransport;
+        share one between the clients of many threads to share its connections
+        :param metrics: optional Metrics that traces every call
+        '''
+        self.cache = cache
+        self.metrics = metrics
+        self.location = location
+        self.precompiled = precompiled
+        self.transport = transport or PooledTransport()
+        self.__envelopes = {}
+        self.__service = SoapClient(location=location, namespace='http://tempuri.org/',
+                                    action='http://tempuri.org/')
         self.header = SimpleXMLElement('<Header/>')
         security = self.header.add_child("GTSIAuthSoapHeader")
         security['xmlns'] = "http://tempuri.org/"
         security.marshall('usuario', os.environ['SPIDER_USER'])
         security.marshall('key', os.environ['SPIDER_KEY'])
 
-    def __replace_special_chars(self, string):
-        '''
-        Replaces vowels with a string accent
-        :param string: sting to remove acents
-        :return: string without vocal acents
-        '''
-        return string.replace('\xf3', 'o').replace('\xe2', 'a').replace('\xed', 'i').replace(
-            '\xe9', 'e').replace('\xfa', 'u').replace('\xc1', 'A').replace('\xc9', 'E').replace(
-                '\xcd', 'I').replace('\xd3', 'O').replace('\xda', 'U').replace(
-                    '\xf1', 'n').replace('\xd1', 'N')
+    def __consume(self, method, *args):
+        '''
+        Call an operation of the web service and extract its records
+        :param method: name of the endpoint e.g. 'ws_consulta_calificaciones'
+        :param args: arguments of the method
+        :return: list of records
+        '''
+        endpoint = ENDPOINTS[method]
+        params = endpoint.bind(*args)
+        if self.metrics is not None:
+            return self.__consume_traced(endpoint, params)
+        return endpoint.extract(self.__rows(endpoint, params))
+
+    def __consume_traced(self, endpoint, params):
+        trace = self.metrics.start(endpoint.method)
+        try:
+            records = endpoint.extract(self.__rows(endpoint, params, trace))
+            trace.lap('cleanup')
+            trace.rows = len(records)
+            return records
+        except Exception as error:
+            trace.error = type(error).__name__
+            raise
+        finally:
+            self.metrics.record(trace)
 
-    def __to_dict(self, order_dict):
+    def __rows(self, endpoint, params, trace=None):
+        if self.cache is not None:
+            return self.cache.cached(endpoint.operation, params,
+                                     lambda: self.__request(endpoint, params, trace))
+        return self.__request(endpoint, params, trace)
+
+    def __request(self, endpoint, params, trace=None):
         '''
-        Convert OrderDict with nested OrderDict in regular dict
-        :param order_dict: object type OrderDict
-        :return: object type dict
+        :return: list of dicts with the rows of the response
         '''
-        return loads(dumps(order_dict))
+        if self.precompiled:
+            xml = self.__send(endpoint.operation, params, trace)
+        else:
+            xml = getattr(self.__service, endpoint.operation)(headers=self.header,
+                                                              **params).as_xml()
+            if trace is not None:
+                # pysimplesoap builds, sends and receives in one step
+                trace.lap('network')
+                trace.response_bytes = len(xml)
+        rows = list(iter_rows(xml, endpoint.table))
+        if trace is not None:
+            trace.lap('parse')
+        return rows
 
-    def __bytes_to_dict(self, byte_object):
+    def __envelope(self, operation, params):
         '''
-        Convert bytes response object to regular dict
+        Return the precompiled envelope of an operation, compiling it once
         '''
-        tmp = str(byte_object.decode('UTF-8', 'replace'))
-        return self.__to_dict(xmltodict.parse(self.__replace_special_chars(tmp),
-                                              process_namespaces=True,
-                                              namespaces=self.namespaces))
+        key = (operation, tuple(params))
+        envelope = self.__envelopes.get(key)
+        if envelope is None:
+            envelope = self.__envelopes[key] = Envelope(operation, key[1],
+                                                        os.environ['SPIDER_USER'],
+                                                        os.environ['SPIDER_KEY'])
+        return envelope
 
-    def __remove_unused_items(self, json):
-        '''
-        Return clean object or list of objects
-        :param json: object list or dict
-        :return: object without noise items
-        '''
-        if isinstance(json, list):
-            result = []
-            for item in json:
-                try:
-                    del item['@urn:schemas-microsoft-com:xml-diffgram-v1:id']
-                    del item['@urn:schemas-microsoft-com:xml-msdata:rowOrder']
-                    del item['@xmlns']
-                except KeyError:
-                    pass
-                result.append(item)
-            return result
-        elif isinstance(json, dict):
-            del json['@xmlns']
-            del json['@urn:schemas-microsoft-com:xml-diffgram-v1:id']
-            del json['@urn:schemas-microsoft-com:xml-msdata:rowOrder']
-            return json
+    def __send(self, operation, params, trace=None):
+        '''
+        Send a precompiled envelope
+        :return: raw bytes of the response
+        '''
+        envelope = self.__envelope(operation, params)
+        body = envelope.build(params)
+        headers = {
+            'Content-Type': 'text/xml; charset="UTF-8"',
+            'SOAPAction': envelope.action,
+        }
+        if trace is None:
+            status, content = self.transport.post(self.location, body, headers)
         else:
-            return json
+            trace.lap('build')
+            trace.request_bytes = len(body)
+            status, content = self.transport.post(self.location, body, headers, trace)
+            trace.response_bytes = len(content)
+        if status != 200:
+            raise soap_fault(content)
+        return content
 
     def ws_consultar_persona_nombres(self, name, lastname):
         '''
         Consume wsConsultarPersonaPorNombres
-        :param name: name of the student
+        :param name: name of the student, may be compound e.g. 'De la Olla'
         :param lastname: lastname of the student
-        :return: object dict with the information or array with coincident people
-        '''
-        if name.isalpha() and lastname.isalpha():
-            response = self.__service.wsConsultarPersonaPorNombres(nombre=name,
-                                                                   apellido=lastname,
-                                                                   headers=self.header)
-            json_response = self.__bytes_to_dict(response.as_xml())
-            json_response = json_response.get('Envelope').get('Body').get(
-                'wsConsultarPersonaPorNombresResponse').get(
-                    'wsConsultarPersonaPorNombresResult').get(
-                        'urn:schemas-microsoft-com:xml-diffgram-v1:diffgram').get(
-                            'NewDataSet').get('DATOSPERSONA')
-            return self.__remove_unused_items(json_response)
-        else:
-            raise AttributeError('name and lastname invalid')
+        :return: list of Person records with the coincident people
+        '''
+        return self.__consume('ws_consultar_persona_nombres', name, lastname)
 
     def ws_consulta_calificaciones(self, year, term, student_code):
         '''
@@ -109,250 +144,115 @@ class Client():
         :param year: year to see grades
         :param term: academic term to see grades
         :param student_code: student id
-        :return: array of dicts with the grades
-        '''
-        if student_code.isdigit() and year.isdigit() and term.isdigit():
-            response = self.__service.wsConsultaCalificaciones(anio=str(year),
-                                                               termino=str(
-                                                                   term),
-                                                               estudiante=student_code,
-                                                               headers=self.header)
-            json_response = self.__bytes_to_dict(response.as_xml())
-            json_response = json_response.get('Envelope').get('Body').get(
-                'wsConsultaCalificacionesResponse').get(
-                    'wsConsultaCalificacionesResult').get(
-                        'urn:schemas-microsoft-com:xml-diffgram-v1:diffgram').get(
-                            'NewDataSet').get('CALIFICACIONES')
-            return self.__remove_unused_items(json_response)
-        else:
-            raise AttributeError('student code must be a string of numbers')
+        :return: list of Grade records, grades and VEZ as numbers
+        '''
+        return self.__consume('ws_consulta_calificaciones', year, term, student_code)
 
     def ws_consulta_codigo_estudiante(self, username):
         '''
         Consume wsConsultaCodigoEstudiante
         :param user: username of the student
-        :return: json with the student code
-        '''
-        if username.isalpha():
-            response = self.__service.wsConsultaCodigoEstudiante(
-                user=username, headers=self.header)
-            json_response = self.__bytes_to_dict(response.as_xml())
-            json_response = json_response.get('Envelope').get(
-                'Body').get('wsConsultaCodigoEstudianteResponse').get(
-                    'wsConsultaCodigoEstudianteResult').get(
-                        'urn:schemas-microsoft-com:xml-diffgram-v1:diffgram').get(
-                            'NewDataSet').get('MATRICULA')
-            return self.__remove_unused_items(json_response)
-        else:
-            raise AttributeError(
-                'username is a string without numbers or special chars')
+        :return: list with the StudentCode record
+        '''
+        return self.__consume('ws_consulta_codigo_estudiante', username)
 
     def ws_consulta_periodo_actual(self):
         '''
         Consume wsConsultaPeriodoActual
-        :return: json with actual academic term
-        '''
-        response = self.__service.wsConsultaPeriodoActual(headers=self.header)
-        json_response = self.__bytes_to_dict(response.as_xml())
-        json_response = json_response.get('Envelope').get('Body').get(
-            'wsConsultaPeriodoActualResponse').get('wsConsultaPeriodoActualResult').get(
-                'urn:schemas-microsoft-com:xml-diffgram-v1:diffgram').get(
-                    'NewDataSet').get('PERIODO')
-        return self.__remove_unused_items(json_response)
+        :return: list with the Period record of the actual academic term
+        '''
+        return self.__consume('ws_consulta_periodo_actual')
 
     def ws_estudiantes_registrados(self, course_code, parallel):
         '''
         Consume wsEstudiantesRegistrados
         :param course_code: code course e.g. 'ICM0001'
         :param parallel: the number of the course to find e.g. 1
-        :return: array with the students {code, name}
-        the name is _x0031_ <- wtf?
-        '''
-        if course_code.isalnum() and parallel.isdigit():
-            response = self.__service.wsEstudiantesRegistrados(codigoMateria=course_code, 
-                paralelo=int(parallel), headers=self.header)
-            json_response = self.__bytes_to_dict(response.as_xml())
-            json_response = json_response.get('Envelope').get('Body').get(
-                'wsEstudiantesRegistradosResponse').get('wsEstudiantesRegistradosResult').get(
-                    'urn:schemas-microsoft-com:xml-diffgram-v1:diffgram').get(
-                        'NewDataSet').get('ESTUDIANTESREGISTRADOS')
-            return self.__remove_unused_items(json_response)
-        else:
-            raise AttributeError('invalid inputs')
+        :return: list of RegisteredStudent records
+        the name comes as _x0031_ <- wtf? it is the NOMBRE field
+        '''
+        return self.__consume('ws_estudiantes_registrados', course_code, parallel)
 
     def ws_horario_clases(self, course_code, parallel):
         '''
         Consume wsHorarioClases
         :param course_code: code course e.g. 'ICM0001'
         :param parallel: the number of the course to find e.g. 1
-        :return: list with hours or dict with 1 hour
-        '''
-        if course_code.isalnum() and parallel.isdigit():
-            response = self.__service.wsHorarioClases(codigoMateria=course_code,
-                paralelo=int(parallel), headers=self.header)
-            json_response = self.__bytes_to_dict(response.as_xml())
-            json_response = json_response.get('Envelope').get('Body').get(
-                'wsHorarioClasesResponse').get('wsHorarioClasesResult').get(
-                    'urn:schemas-microsoft-com:xml-diffgram-v1:diffgram').get(
-                        'NewDataSet').get('HORARIOCLASES')
-            return self.__remove_unused_items(json_response)
-        else:
-            raise AttributeError('invalid inputs')
+        :return: list of ClassHour records
+        '''
+        return self.__consume('ws_horario_clases', course_code, parallel)
 
     def ws_horario_examenes(self, course_code, parallel):
         '''
         Consume wsHorarioExamenes
         :param course_code: code course e.g. 'ICM0001'
         :param parallel: the number of the course to find e.g. 1
-        :return: list with tests date
-        '''
-        if course_code.isalnum() and parallel.isdigit():
-            response = self.__service.wsHorarioExamenes(codigoMateria=course_code,
-                paralelo=int(parallel), headers=self.header)
-            json_response = self.__bytes_to_dict(response.as_xml())
-            json_response = json_response.get('Envelope').get('Body').get(
-                'wsHorarioExamenesResponse').get('wsHorarioExamenesResult').get(
-                    'urn:schemas-microsoft-com:xml-diffgram-v1:diffgram').get(
-                        'NewDataSet').get('_x0020__x0020_')
-            # '_x0020__x0020_' <- wtf? 
-            return self.__remove_unused_items(json_response)
-        else:
-            raise AttributeError('invalid inputs')
+        :return: list of ExamDate records
+        '''
+        return self.__consume('ws_horario_examenes', course_code, parallel)
 
     def ws_materias_registradas(self, student_code):
         '''
         Consume wsMateriasRegistradas
         :param student_code: student id
+        :return: list of RegisteredCourse records
         '''
-        if student_code.isdigit():
-            response  = self.__service.wsMateriasRegistradas(codigoestudiante=student_code,
-                headers=self.header)
-            json_response = self.__bytes_to_dict(response.as_xml())
-            json_response = json_response.get('Envelope').get('Body').get(
-                'wsMateriasRegistradasResponse').get('wsMateriasRegistradasResult').get(
-                    'urn:schemas-microsoft-com:xml-diffgram-v1:diffgram').get(
-                        'NewDataSet').get('MATERIASREGISTRADAS')
-            return self.__remove_unused_items(json_response)
-        else:
-            raise AttributeError('student code must be a string of numbers')
+        return self.__consume('ws_materias_registradas', student_code)
 
     def ws_info_estudiante_general(self, student_code):
         '''
         Consume wsInfoEstudianteGeneral
         :param student_code: student id
+        :return: list of StudentGeneral records
         '''
-        if student_code.isdigit():
-            response = self.__service.wsInfoEstudianteGeneral(codestudiante=student_code,
-                headers=self.header)
-            json_response = self.__bytes_to_dict(response.as_xml())
-            json_response = json_response.get('Envelope').get('Body').get(
-                'wsInfoEstudianteGeneralResponse').get('wsInfoEstudianteGeneralResult').get(
-                    'urn:schemas-microsoft-com:xml-diffgram-v1:diffgram').get(
-                        'NewDataSet').get('ESTUDIANTE')
-            return self.__remove_unused_items(json_response)
-        else:
-            raise AttributeError('student code must be a string of numbers')
-    
+        return self.__consume('ws_info_estudiante_general', student_code)
+
     def ws_info_estudiante(self, student_code):
         '''
         consume wsInfoEstudiante
         :param student_code: student id
+        :return: list of StudentInfo records
         '''
-        if student_code.isdigit():
-            response = self.__service.wsInfoEstudiante(codigoEstudiante=student_code,
-                headers=self.header)
-            json_response = self.__bytes_to_dict(response.as_xml())
-            json_response = json_response.get('Envelope').get('Body').get(
-                'wsInfoEstudianteResponse').get('wsInfoEstudianteResult').get(
-                    'urn:schemas-microsoft-com:xml-diffgram-v1:diffgram').get(
-                        'NewDataSet').get('INFOESTUDIANTE')
-            return self.__remove_unused_items(json_response)
-        else:
-            raise AttributeError('student code must be a string of numbers')
-    
+        return self.__consume('ws_info_estudiante', student_code)
+
     def ws_info_estudiante_carrera(self, student_code):
         '''
         Consume wsInfoEstudianteCarrera
         :param student_code: student id
+        :return: list of StudentCareer records
         '''
-        if student_code.isdigit():
-            response = self.__service.wsInfoEstudianteCarrera(codigoEstudiante=student_code,
-                headers=self.header)
-            json_response = self.__bytes_to_dict(response.as_xml())
-            json_response = json_response.get('Envelope').get('Body').get(
-                'wsInfoEstudianteCarreraResponse').get('wsInfoEstudianteCarreraResult').get(
-                    'urn:schemas-microsoft-com:xml-diffgram-v1:diffgram').get(
-                        'NewDataSet').get('ESTUDIANTECARRERA')
-            return self.__remove_unused_items(json_response)
-        else:
-            raise AttributeError('student code must be a string of numbers')
-    
+        return self.__consume('ws_info_estudiante_carrera', student_code)
+
     def ws_info_personal_estudiante(self, student_code, dni):
         '''
         Consume wsInfoPersonalEstudiante
         :param student_code: student id
         :param dni: dni code
+        :return: list of StudentPersonal records
         '''
-        if student_code.isdigit() and dni.isdigit():
-            response = self.__service.wsInfoPersonalEstudiante(matricula=student_code,
-                identificacion=dni, headers=self.header)
-            json_response = self.__bytes_to_dict(response.as_xml())
-            json_response = json_response.get('Envelope').get('Body').get(
-                'wsInfoPersonalEstudianteResponse').get('wsInfoPersonalEstudianteResult').get(
-                    'urn:schemas-microsoft-com:xml-diffgram-v1:diffgram').get(
-                        'NewDataSet').get('INFOPERSONALESTUDIANTE')
-            return self.__remove_unused_items(json_response)
-        else:
-            raise AttributeError('student code or dni invalid')
-    
+        return self.__consume('ws_info_personal_estudiante', student_code, dni)
+
     def ws_info_usuario(self, user):
         '''
         Consume wsInfoUsuario
         :param user: username in the academic system
+        :return: list of UserInfo records
         '''
-        if user.isalpha():
-            response = self.__service.wsInfoUsuario(usuario=user,
-                headers=self.header)
-            json_response = self.__bytes_to_dict(response.as_xml())
-            json_response = json_response.get('Envelope').get('Body').get(
-                'wsInfoUsuarioResponse').get('wsInfoUsuarioResult').get(
-                    'urn:schemas-microsoft-com:xml-diffgram-v1:diffgram').get(
-                        'NewDataSet').get('INFORMACIONUSUARIO')
-            return self.__remove_unused_items(json_response)
-        else:
-            raise AttributeError('username incorrect')
-    
+        return self.__consume('ws_info_usuario', user)
+
     def ws_info_paralelo(self, course_code, parallel):
         '''
         Consume wsInfoparalelo
         :param course_code: code course e.g. 'ICM0001'
         :param parallel: the number of the course to find e.g. 1
+        :return: list of CourseInfo records
         '''
-        if course_code.isalnum() and parallel.isdigit():
-            response = self.__service.wsInfoparalelo(codigoMateria=course_code,
-                paralelo=int(parallel), headers=self.header)
-            json_response = self.__bytes_to_dict(response.as_xml())
-            json_response = json_response.get('Envelope').get('Body').get(
-                'wsInfoparaleloResponse').get('wsInfoparaleloResult').get(
-                    'urn:schemas-microsoft-com:xml-diffgram-v1:diffgram').get(
-                        'NewDataSet').get('INFORMACIONMATERIA')
-            return self.__remove_unused_items(json_response)
-        else:
-            raise AttributeError('invalid inputs')
-    
+        return self.__consume('ws_info_paralelo', course_code, parallel)
+
     def ws_materias_disponibles(self, student_code):
         '''
         Consume wsMateriasDisponibles
-        :param student_code: student id 
-        '''
-        if student_code.isdigit():
-            response = self.__service.wsMateriasDisponibles(codigoestudiante=student_code,
-                headers=self.header)
-            json_response = self.__bytes_to_dict(response.as_xml())
-            json_response = json_response.get('Envelope').get('Body').get(
-                'wsMateriasDisponiblesResponse').get('wsMateriasDisponiblesResult').get(
-                    'urn:schemas-microsoft-com:xml-diffgram-v1:diffgram').get(
-                        'NewDataSet').get('MATERIASDISPONIBLES')
-            return self.__remove_unused_items(json_response)
-        else:
-            raise AttributeError('student code must be a string of numbers')
+        :param student_code: student id
+        :return: list of AvailableCourse records
+        '''
+        return self.__consume('ws_materias_disponibles', student_code)
@@ -0,0 +1,417 @@
+'''
+Crawl of the students of many courses spread over worker processes that
+share a durable work queue
+'''
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from .Client import Client
+from .GradeHarvester import Progress, student_code
+from .Resilience import CircuitBreaker, ResilientClient, SharedRateLimiter
+
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.wsSp1d3r', 'crawl.sqlite3')
+
+# arguments of each kind of unit and name of its result in the exports
+UNITS = {
+    'roster': (('course', 'parallel'), 'students'),
+    'info': (('student',), 'info'),
+    'grades': (('student', 'year', 'term'), 'grades'),
+}
+
+# owner and attempts identify the lease, a unit leased again gets another one
+Unit = namedtuple('Unit', 'id kind args attempts owner')
+
+
+def _key(args):
+    return json.dumps([str(arg) for arg in args])
+
+
+class WorkQueue():
+    '''
+    WorkQueue keeps the units of a crawl and their results in SQLite, so
+    every process opens its own WorkQueue on the same file.
+
+    A leased unit stays queued but is hidden until its lease expires: a
+    worker that dies without completing it does not lose it, another worker
+    leases it again once the visibility timeout passes. Workers extend the
+    leases of the units they are still running, and a worker whose lease was
+    lost can no longer complete or fail the unit.
+    '''
+
+    def __init__(self, path=DEFAULT_PATH, lease_timeout=120.0, max_attempts=3):
+        '''
+        :param path: sqlite file shared by the coordinator and the workers
+        :param lease_timeout: seconds a leased unit is hidden from other workers
+        :param max_attempts: leases of a unit before it is marked failed
+        '''
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.__db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        self.__db.execute('PRAGMA synchronous=NORMAL')
+        self.__db.execute('CREATE TABLE IF NOT EXISTS units ('
+                          'id INTEGER PRIMARY KEY, kind TEXT, args TEXT, state TEXT, '
+                          'visible REAL, owner TEXT, attempts INTEGER, error TEXT, '
+                          'UNIQUE (kind, args))')
+        # the queued units in order of id, the hidden ones at the head are few
+        self.__db.execute('CREATE INDEX IF NOT EXISTS queued ON units (state)')
+        self.__db.execute('CREATE TABLE IF NOT EXISTS results ('
+                          'kind TEXT, args TEXT, data TEXT, PRIMARY KEY (kind, args))')
+
+    def __transaction(self):
+        # IMMEDIATE takes the write lock first, so two workers never lease the same unit
+        self.__db.execute('BEGIN IMMEDIATE')
+
+    def put(self, kind, units):
+        '''
+        Queue units, the ones already known (done or not) are ignored
+        :param kind: one of UNITS
+        :param units: iterable of tuples of arguments
+        :return: number of units added
+        '''
+        self.__transaction()
+        try:
+            added = self.__put(kind, units)
+            self.__db.execute('COMMIT')
+        except BaseException:
+            self.__db.execute('ROLLBACK')
+            raise
+        return added
+
+    def __put(self, kind, units):
+        if kind not in UNITS:
+            raise AttributeError('kind must be one of {}'.format(', '.join(UNITS)))
+        before = self.__db.total_changes
+        self.__db.executemany("INSERT OR IGNORE INTO units (kind, args, state, visible, attempts) "
+                              "VALUES (?, ?, 'queued', 0, 0)",
+                              ((kind, _key(args)) for args in units))
+        return self.__db.total_changes - before
+
+    def lease(self, owner):
+        '''
+        Take the oldest visible unit and hide it for lease_timeout seconds
+        :param owner: name of the worker
+        :return: Unit or None if no unit is visible
+        '''
+        now = time.time()
+        self.__transaction()
+        try:
+            while True:
+                row = self.__db.execute("SELECT id, kind, args, attempts FROM units "
+                                        "WHERE state = 'queued' AND visible <= ? "
+                                        "ORDER BY id LIMIT 1", (now,)).fetchone()
+                if row is None or row[3] < self.max_attempts:
+                    break
+                # its leases kept expiring, it likely kills its workers
+                self.__db.execute("UPDATE units SET state = 'failed', owner = NULL, "
+                                  "error = 'lease expired' WHERE id = ?", (row[0],))
+            if row is not None:
+                self.__db.execute('UPDATE units SET visible = ?, owner = ?, attempts = ? '
+                                  'WHERE id = ?',
+                                  (now + self.lease_timeout, owner, row[3] + 1, row[0]))
+            self.__db.execute('COMMIT')
+        except BaseException:
+            self.__db.execute('ROLLBACK')
+            raise
+        if row is None:
+            return None
+        return Unit(row[0], row[1], tuple(json.loads(row[2])), row[3] + 1, owner)
+
+    def extend(self, unit):
+        '''
+        Hide a leased unit for lease_timeout seconds more
+        :return: False if the lease was lost
+        '''
+        return self.__db.execute("UPDATE units SET visible = ? WHERE id = ? AND state = 'queued' "
+                                 "AND owner = ? AND attempts = ?",
+                                 (time.time() + self.lease_timeout, unit.id, unit.owner,
+                                  unit.attempts)).rowcount > 0
+
+    def complete(self, unit, data, children=()):
+        '''
+        Store the result of a unit and queue the units it found, atomically
+        :param data: json serializable result
+        :param children: iterable of tuples (kind, args)
+        :return: False if the lease was lost, nothing is stored then
+        '''
+        self.__transaction()
+        try:
+            if not self.__db.execute("UPDATE units SET state = 'done', owner = NULL, error = NULL "
+                                     "WHERE id = ? AND state = 'queued' AND owner = ? "
+                                     "AND attempts = ?",
+                                     (unit.id, unit.owner, unit.attempts)).rowcount:
+                self.__db.execute('ROLLBACK')
+                return False
+            self.__db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                              (unit.kind, _key(unit.args),
+                               json.dumps(data, ensure_ascii=False)))
+            for kind, args in children:
+                self.__put(kind, [args])
+            self.__db.execute('COMMIT')
+        except BaseException:
+            self.__db.execute('ROLLBACK')
+            raise
+        return True
+
+    def fail(self, unit, error, delay=0.0):
+        '''
+        Give a unit back to be retried after delay seconds, or mark it failed
+        when it ran out of attempts
+        :return: False if the lease was lost, the unit is left as it is then
+        '''
+        lease = "WHERE id = ? AND state = 'queued' AND owner = ? AND attempts = ?"
+        if unit.attempts >= self.max_attempts:
+            cursor = self.__db.execute("UPDATE units SET state = 'failed', owner = NULL, "
+                                       "error = ? " + lease,
+                                       (error, unit.id, unit.owner, unit.attempts))
+        else:
+            cursor = self.__db.execute('UPDATE units SET visible = ?, owner = NULL, error = ? '
+                                       + lease, (time.time() + delay, error, unit.id,
+                                                 unit.owner, unit.attempts))
+        return cursor.rowcount > 0
+
+    def requeue(self, owner):
+        '''
+        Make the units leased by a dead worker visible again
+        :return: number of units requeued
+        '''
+        return self.__db.execute("UPDATE units SET visible = 0, owner = NULL "
+                                 "WHERE state = 'queued' AND owner = ?", (owner,)).rowcount
+
+    def retry_failed(self):
+        '''
+        Queue again the units that failed
+        :return: number of units queued
+        '''
+        return self.__db.execute("UPDATE units SET state = 'queued', visible = 0, attempts = 0 "
+                                 "WHERE state = 'failed'").rowcount
+
+    def counts(self):
+        '''
+        :return: dict with the number of units pending, leased, done and failed
+        '''
+        counts = dict.fromkeys(('pending', 'leased', 'done', 'failed'), 0)
+        for state, leased, count in self.__db.execute(
+                'SELECT state, visible > ?, COUNT(*) FROM units GROUP BY 1, 2', (time.time(),)):
+            if state == 'queued':
+                state = 'leased' if leased else 'pending'
+            counts[state] += count
+        return counts
+
+    def queued(self):
+        '''
+        :return: True while some unit is not done or failed
+        '''
+        return self.__db.execute("SELECT 1 FROM units WHERE state = 'queued' "
+                                 "LIMIT 1").fetchone() is not None
+
+    def results(self, kind):
+        '''
+        :param kind: one of UNITS
+        :return: generator of dicts with the arguments of each unit and its result
+        '''
+        fields, name = UNITS[kind]
+        for args, data in self.__db.execute('SELECT args, data FROM results WHERE kind = ? '
+                                            'ORDER BY rowid', (kind,)):
+            row = dict(zip(fields, json.loads(args)))
+            row[name] = json.loads(data)
+            yield row
+
+    def close(self):
+        self.__db.close()
+
+
+def run_unit(client, unit, terms):
+    '''
+    Call the web service for a unit
+    :param terms: list of tuples (year, term) of the grades of each student
+    :return: tuple (result, children)
+    '''
+    if unit.kind == 'roster':
+        students = client.ws_estudiantes_registrados(*unit.args)
+        children = []
+        for code in dict.fromkeys(filter(None, map(student_code, students))):
+            children.append(('info', (code,)))
+            children.extend(('grades', (code, year, term)) for year, term in terms)
+        return [student._asdict() for student in students], children
+    if unit.kind == 'info':
+        return [record._asdict() for record in client.ws_info_estudiante_general(*unit.args)], ()
+    student, year, term = unit.args
+    return [grade._asdict() for grade in
+            client.ws_consulta_calificaciones(year, term, student)], ()
+
+
+def work(path, terms, limiter, client_factory=Client, lease_timeout=120.0, max_attempts=3,
+         poll=0.5):
+    '''
+    Loop of a worker process: lease a unit, run it and store its result until
+    the queue is empty. The diffgram parsing of each worker runs on its own core.
+    A heartbeat thread extends the lease of the running unit, so a slow unit
+    is not leased again by another worker.
+    :param limiter: limiter shared by the workers e.g. SharedRateLimiter
+    :param client_factory: callable that returns the Client of the worker
+    '''
+    owner = str(os.getpid())
+    queue = WorkQueue(path, lease_timeout, max_attempts)
+    client = ResilientClient(client_factory(), limiter, CircuitBreaker())
+    running = [None]
+    stopped = threading.Event()
+
+    def heartbeat():
+        # sqlite connections stay on the thread that opened them
+        leases = WorkQueue(path, lease_timeout, max_attempts)
+        try:
+            while not stopped.wait(lease_timeout / 3):
+                unit = running[0]
+                if unit is not None:
+                    leases.extend(unit)
+        finally:
+            leases.close()
+
+    beating = threading.Thread(target=heartbeat, daemon=True)
+    beating.start()
+    try:
+        while True:
+            unit = queue.lease(owner)
+            if unit is None:
+                if not queue.queued():
+                    return
+                # units leased by other workers may still add children or expire
+                time.sleep(poll)
+                continue
+            running[0] = unit
+            try:
+                data, children = run_unit(client, unit, terms)
+            except Exception as error:
+                queue.fail(unit, '{}: {}'.format(type(error).__name__, error),
+                           delay=poll * 2 ** unit.attempts)
+                continue
+            finally:
+                running[0] = None
+            queue.complete(unit, data, children)
+    finally:
+        stopped.set()
+        beating.join()
+        queue.close()
+
+
+class CrawlCoordinator():
+    '''
+    CrawlCoordinator seeds the queue with the rosters of some courses and
+    runs worker processes until every unit is done or failed. Each roster
+    queues the general info of its students and their grades of each term.
+
+    The workers share one rate limit. A worker that crashes gets its leases
+    requeued right away and is replaced while there is work left. Running
+    again with the same queue file resumes the crawl.
+    '''
+
+    def __init__(self, path=DEFAULT_PATH, processes=None, rate=20.0, burst=None,
+                 lease_timeout=120.0, max_attempts=3, client_factory=Client,
+                 progress_stream=sys.stderr):
+        '''
+        :param path: sqlite file with the queue and the results
+        :param processes: number of worker processes, by default one per core
+        :param rate: calls per second of all the workers together
+        :param burst: calls allowed at once, by default the number of processes
+        :param lease_timeout: seconds before the unit of a stuck worker is leased again
+        :param max_attempts: tries of each unit
+        :param client_factory: picklable callable that returns a new Client e.g. Client
+        :param progress_stream: stream for the progress report, None to disable it
+        '''
+        self.path = path
+        self.processes = processes or os.cpu_count() or 1
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.client_factory = client_factory
+        self.progress_stream = progress_stream
+        # sqlite connections must not cross a fork
+        self.context = multiprocessing.get_context('spawn')
+        self.limiter = SharedRateLimiter(rate, burst or self.processes, self.context)
+        self.queue = WorkQueue(path, lease_timeout, max_attempts)
+
+    def seed(self, courses):
+        '''
+        :param courses: list of tuples (course_code, parallel)
+        :return: number of rosters added
+        '''
+        return self.queue.put('roster', courses)
+
+    def __spawn(self, terms):
+        process = self.context.Process(
+            target=work, args=(self.path, terms, self.limiter, self.client_factory,
+                               self.lease_timeout, self.max_attempts), daemon=True)
+        process.start()
+        return process
+
+    def run(self, courses, terms, every=2.0):
+        '''
+        Crawl until the queue is empty
+        :param courses: list of tuples (course_code, parallel)
+        :param terms: list of tuples (year, term)
+        :return: dict with the number of units pending, leased, done and failed
+        '''
+        self.seed(courses)
+        terms = [(str(year), str(term)) for year, term in terms]
+        counts = self.queue.counts()
+        progress = Progress(sum(counts.values()), counts['done'], self.progress_stream, every)
+        workers = [self.__spawn(terms) for _ in range(self.processes)]
+        # a worker that dies on start would be replaced forever
+        replacements = self.processes * self.max_attempts
+        counted = time.monotonic()
+        try:
+            while workers:
+                time.sleep(0.1)
+                for process in [process for process in workers if not process.is_alive()]:
+                    # workers exit by themselves once the queue is empty
+                    workers.remove(process)
+                    if process.exitcode == 0:
+                        continue
+                    self.queue.requeue(str(process.pid))
+                    if self.progress_stream is not None:
+                        self.progress_stream.write('worker {} died with code {}\n'.format(
+                            process.pid, process.exitcode))
+                    if replacements > 0 and self.queue.queued():
+                        replacements -= 1
+                        workers.append(self.__spawn(terms))
+                if time.monotonic() - counted >= every:
+                    counted = time.monotonic()
+                    counts = self.queue.counts()
+                    progress.total = sum(counts.values())
+                    progress.update(done=counts['done'] - progress.done,
+                                    failed=counts['failed'] - progress.failed)
+        finally:
+            for process in workers:
+                process.terminate()
+            for process in workers:
+                process.join()
+                self.queue.requeue(str(process.pid))
+            counts = self.queue.counts()
+            progress.total = sum(counts.values())
+            progress.update(done=counts['done'] - progress.done,
+                            failed=counts['failed'] - progress.failed, force=True)
+        return counts
+
+    def export(self, kind, stream):
+        '''
+        Write the results of a kind of unit as json lines, the grades in the
+        format of a GradeHarvester checkpoint
+        :return: number of lines written
+        '''
+        written = 0
+        for row in self.queue.results(kind):
+            stream.write(json.dumps(row, ensure_ascii=False) + '\n')
+            written += 1
+        return written
+
+    def close(self):
+        self.queue.close()
@@ -0,0 +1,298 @@
+'''
+Long lived daemon that keeps a warm Client behind a local Unix socket and
+the thin client of the front ends.
+
+The protocol is one json object per line. A request is
+{"method": "ws_...", "args": [...]} and its answer is one line per record
+{"record": {...}} followed by {"end": <number of records>}, or an
+{"error": <message>, "type": <exception name>} line.
+'''
+import json
+import os
+import socket
+import socketserver
+import threading
+
+from .Endpoints import ENDPOINTS
+
+
+DEFAULT_SOCKET = os.path.join(os.path.expanduser('~'), '.wsSp1d3r', 'daemon.sock')
+
+
+class RemoteError(Exception):
+    '''
+    The daemon failed to answer, type is the name of the exception raised there
+    '''
+
+    def __init__(self, message, type):
+        Exception.__init__(self, message)
+        self.type = type
+
+
+def error_name(error):
+    '''
+    :return: name of the exception, the one raised in the daemon for a RemoteError
+    '''
+    if isinstance(error, RemoteError):
+        return error.type
+    return type(error).__name__
+
+
+class Daemon():
+    '''
+    Daemon answers the ws_* methods of a Client, the searches of people
+    through the local index and renders tables, so the front ends only
+    import json and socket.
+
+    Every connection is served by its own thread and may send many requests.
+    '''
+
+    def __init__(self, path=DEFAULT_SOCKET, client=None, index=None):
+        '''
+        :param path: path of the Unix socket, only the user may connect
+        :param client: Client to use, by default a ResilientClient over a cached Client
+        :param index: PersonIndex for search_people, by default the one of the user
+        '''
+        from .Client import Client
+        from .PersonIndex import PersonIndex
+        from .Resilience import ResilientClient
+        from .ResponseCache import ResponseCache
+
+        self.path = path
+        self.client = client if client is not None else ResilientClient(
+            Client(cache=ResponseCache()))
+        self.index = index if index is not None else PersonIndex.load()
+        self.__thread = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if os.path.exists(path):
+            # a socket left by a daemon that died, a live one answers
+            if DaemonClient.connect(path) is not None:
+                raise OSError('a daemon is already listening on {}'.format(path))
+            os.unlink(path)
+        umask = os.umask(0o077)
+        try:
+            self.__server = socketserver.ThreadingUnixStreamServer(path, self.__handler())
+        finally:
+            os.umask(umask)
+        self.__server.daemon_threads = True
+
+    def search_people(self, name, lastname):
+        from .PersonIndex import search_people
+
+        return search_people(self.client, self.index, name, lastname)
+
+    @staticmethod
+    def tabulate(rows, headers=(), tablefmt='simple'):
+        from tabulate import tabulate
+
+        return tabulate(rows, headers=headers, tablefmt=tablefmt)
+
+    def answer(self, request, write):
+        '''
+        Run a request and write its answer
+        :param request: dict with method and args
+        :param write: callable that sends one json line
+        '''
+        method = request.get('method')
+        args = request.get('args', [])
+        try:
+            if method in ENDPOINTS:
+                records = getattr(self.client, method)(*args)
+            elif method == 'search_people':
+                records = self.search_people(*args)
+            elif method == 'tabulate':
+                write({'text': self.tabulate(*args)})
+                return
+            elif method == 'ping':
+                write({'end': 0})
+                return
+            elif method == 'shutdown':
+                write({'end': 0})
+                threading.Thread(target=self.stop, daemon=True).start()
+                return
+            else:
+                raise AttributeError('unknown method {}'.format(method))
+        except Exception as error:
+            write({'error': str(error), 'type': type(error).__name__})
+            return
+        for record in records:
+            write({'record': record._asdict()})
+        write({'end': len(records)})
+
+    def __handler(self):
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+
+            def handle(self):
+                def write(message):
+                    self.wfile.write(json.dumps(message, ensure_ascii=False).encode('utf-8')
+                                     + b'\n')
+
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                    except ValueError:
+                        write({'error': 'invalid request', 'type': 'ValueError'})
+                        continue
+                    daemon.answer(request, write)
+                    self.wfile.flush()
+
+        return Handler
+
+    def serve_forever(self):
+        try:
+            self.__server.serve_forever()
+        finally:
+            self.close()
+
+    def start(self):
+        '''
+        Serve in a background thread
+        :return: self
+        '''
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.close()
+
+    def close(self):
+        self.__server.server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.index.save()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def _method(name):
+    def method(self, *args):
+        return self.call(name, *args)
+    method.__name__ = name
+    method.__doc__ = '''
+        Call {} on the daemon
+        :return: list of records
+        '''.format(name)
+    return method
+
+
+class DaemonClient():
+    '''
+    DaemonClient has the ws_* methods of Client but forwards them to a
+    running Daemon. Records are rebuilt with the types of Endpoints.
+    '''
+
+    def __init__(self, path=DEFAULT_SOCKET, timeout=120):
+        '''
+        :raise OSError: when no daemon listens on path
+        '''
+        self.path = path
+        self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__socket.settimeout(timeout)
+        try:
+            self.__socket.connect(path)
+        except OSError:
+            self.__socket.close()
+            raise
+        self.__input = self.__socket.makefile('rb')
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def connect(cls, path=DEFAULT_SOCKET, timeout=120):
+        '''
+        :return: DaemonClient or None when no daemon is running
+        '''
+        try:
+            return cls(path, timeout)
+        except OSError:
+            return None
+
+    def __request(self, method, args):
+        self.__socket.sendall(json.dumps({'method': method, 'args': list(args)},
+                                         ensure_ascii=False).encode('utf-8') + b'\n')
+        for line in self.__input:
+            message = json.loads(line)
+            if 'error' in message:
+                if message['type'] == 'AttributeError':
+                    raise AttributeError(message['error'])
+                raise RemoteError(message['error'], message['type'])
+            yield message
+            if 'end' in message or 'text' in message:
+                return
+        raise ConnectionError('the daemon closed the connection')
+
+    def stream(self, method, *args):
+        '''
+        Yield the records as the daemon sends them
+        :param method: ws_* method or 'search_people'
+        '''
+        endpoint = ENDPOINTS['ws_consultar_persona_nombres' if method == 'search_people'
+                             else method]
+        with self.__lock:
+            messages = self.__request(method, args)
+            try:
+                for message in messages:
+                    if 'record' in message:
+                        record = message['record']
+                        extras = tuple(name for name in record if name not in endpoint.fields)
+                        yield endpoint.record_type(extras)(**record)
+            finally:
+                # a stream left half read would answer the next request
+                for _ in messages:
+                    pass
+
+    def call(self, method, *args):
+        '''
+        :return: list of records
+        '''
+        return list(self.stream(method, *args))
+
+    def search_people(self, name, lastname):
+        '''
+        Search people through the index of the daemon
+        :return: list of Person records
+        '''
+        return self.call('search_people', name, lastname)
+
+    def tabulate(self, rows, headers=(), tablefmt='simple'):
+        '''
+        Render a table with the tabulate of the daemon
+        :return: string
+        '''
+        with self.__lock:
+            for message in self.__request('tabulate', (rows, list(headers), tablefmt)):
+                return message['text']
+
+    def ping(self):
+        with self.__lock:
+            for _ in self.__request('ping', ()):
+                pass
+
+    def shutdown(self):
+        '''
+        Stop the daemon
+        '''
+        with self.__lock:
+            for _ in self.__request('shutdown', ()):
+                pass
+
+    def close(self):
+        self.__input.close()
+        self.__socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+for _name in ENDPOINTS:
+    setattr(DaemonClient, _name, _method(_name))
@@ -0,0 +1,127 @@
+'''
+Incremental parser for the diffgram responses of Espol Web Services
+'''
+from xml.etree.ElementTree import XMLPullParser
+
+
+DIFFGRAM_NAMESPACE = 'urn:schemas-microsoft-com:xml-diffgram-v1'
+DATASET = 'NewDataSet'
+CHUNK_SIZE = 64 * 1024
+
+ACCENTS = str.maketrans('\xe1\xe2\xe9\xed\xf3\xfa\xc1\xc9\xcd\xd3\xda\xf1\xd1',
+                        'aaeiouAEIOUnN')
+
+
+def local_name(tag):
+    '''
+    Remove the namespace of an ElementTree tag
+    :param tag: tag like '{http://tempuri.org/}NewDataSet'
+    :return: tag without namespace e.g. 'NewDataSet'
+    '''
+    return tag.rsplit('}', 1)[-1]
+
+
+def replace_special_chars(string):
+    '''
+    Replaces vowels with a string accent
+    :param string: string to remove accents
+    :return: string without vocal accents
+    '''
+    return string.translate(ACCENTS)
+
+
+class DiffgramParser():
+    '''
+    DiffgramParser reads a SOAP diffgram response chunk by chunk and yields
+    one clean dict per NewDataSet row, dropping the diffgram/msdata
+    attributes and accents on the way
+    '''
+
+    def __init__(self, table=None):
+        '''
+        :param table: row tag to keep e.g. 'CALIFICACIONES', None keeps every row
+        '''
+        self.table = table
+        self.__parser = XMLPullParser(events=('start', 'end'))
+        self.__depth = 0
+        self.__diffgram_depth = None
+        self.__dataset = None
+        self.__dataset_depth = None
+        self.__row = None
+
+    def feed(self, chunk):
+        '''
+        Feed bytes of the response
+        :param chunk: bytes of the xml document
+        :return: generator with the rows completed by this chunk
+        '''
+        self.__parser.feed(chunk)
+        return self.__read_rows()
+
+    def close(self):
+        '''
+        Finish the document
+        :return: generator with the remaining rows
+        '''
+        self.__parser.close()
+        return self.__read_rows()
+
+    def __read_rows(self):
+        for event, element in self.__parser.read_events():
+            if event == 'start':
+                self.__depth += 1
+                self.__start(element)
+            else:
+                row = self.__end(element)
+                self.__depth -= 1
+                if row is not None:
+                    yield row
+
+    def __start(self, element):
+        if self.__diffgram_depth is None:
+            if element.tag == '{%s}diffgram' % DIFFGRAM_NAMESPACE:
+                self.__diffgram_depth = self.__depth
+        elif self.__dataset is None:
+            if self.__depth == self.__diffgram_depth + 1 and local_name(element.tag) == DATASET:
+                self.__dataset = element
+                self.__dataset_depth = self.__depth
+        elif self.__depth == self.__dataset_depth + 1:
+            self.__row = {}
+
+    def __end(self, element):
+        if self.__dataset is None or self.__depth <= self.__dataset_depth:
+            if element is self.__dataset:
+                self.__dataset = None
+            return None
+        if self.__depth == self.__dataset_depth + 2:
+            text = element.text
+            if text is not None:
+                text = replace_special_chars(text.strip()) or None
+            self.__row[local_name(element.tag)] = text
+            return None
+        if self.__depth == self.__dataset_depth + 1:
+            row, self.__row = self.__row, None
+            # rows already yielded are not needed anymore
+            self.__dataset.clear()
+            if self.table is None or local_name(element.tag) == self.table:
+                return row
+        return None
+
+
+def iter_rows(xml, table=None):
+    '''
+    Parse the rows of a diffgram response
+    :param xml: bytes of the response or iterable of bytes chunks
+    :param table: row tag to keep e.g. 'CALIFICACIONES'
+    :return: generator of dicts, one per row
+    '''
+    parser = DiffgramParser(table)
+    if isinstance(xml, (bytes, bytearray)):
+        view = memoryview(xml)
+        chunks = (view[i:i + CHUNK_SIZE] for i in range(0, len(view), CHUNK_SIZE))
+    else:
+        chunks = xml
+    for chunk in chunks:
+        yield from parser.feed(bytes(chunk))
+    yield from parser.close()
+
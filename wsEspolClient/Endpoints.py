@@ -0,0 +1,245 @@
+'''
+Declarative registry of the operations of Espol Web Services
+'''
+import keyword
+import re
+from collections import namedtuple
+
+
+XML_NAME_ESCAPE = re.compile(r'_x([0-9A-Fa-f]{4})_')
+
+
+def is_name(value):
+    '''
+    Names and lastnames may be compound e.g. 'De la Olla'
+    '''
+    return value.replace(' ', '').isalpha()
+
+
+def to_float(value):
+    '''
+    :param value: string like '75.50'
+    :return: float or None if the value is empty or not a number
+    '''
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_int(value):
+    '''
+    :param value: string like '2'
+    :return: int or None if the value is empty or not a number
+    '''
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def clean_text(value):
+    '''
+    Remove the html spaces the web service leaves in some fields e.g. 'AP&nbsp;'
+    '''
+    if value is None:
+        return None
+    return value.replace('&nbsp;', '').strip()
+
+
+def field_name(tag):
+    '''
+    Turn a column tag into a valid record field
+    :param tag: column tag e.g. 'NOMBRES' or '_x0031_'
+    :return: identifier e.g. 'NOMBRES' or 'F1'
+    '''
+    name = XML_NAME_ESCAPE.sub(lambda match: chr(int(match.group(1), 16)), tag)
+    name = re.sub(r'\W', '_', name).strip('_') or 'FIELD'
+    if not name.isidentifier() or keyword.iskeyword(name):
+        name = 'F' + name
+    return name
+
+
+class Param(namedtuple('Param', 'name check convert')):
+    '''
+    Parameter of an operation
+    :name: tag of the parameter in the request e.g. 'anio'
+    :check: callable that validates the argument of the method
+    :convert: callable that converts the argument into the value sent
+    '''
+    __slots__ = ()
+
+    def __new__(cls, name, check, convert=str):
+        return super().__new__(cls, name, check, convert)
+
+
+class Endpoint():
+    '''
+    Endpoint declares one operation: its parameters, the tag of its rows
+    inside NewDataSet and the schema of the records it returns.
+
+    Records are namedtuples with the declared fields first (None when the
+    row does not bring them) and any other column of the response after.
+    The web service leaves out the null columns of a row, so every record of
+    a response has the same type, built from the columns of all its rows.
+    The extraction plan of each set of columns is compiled once.
+    '''
+
+    def __init__(self, method, operation, table, params=(), record='Record', fields=(),
+                 converters=None, aliases=None, error='invalid inputs'):
+        '''
+        :param method: name of the Client method e.g. 'ws_consulta_calificaciones'
+        :param operation: name of the operation e.g. 'wsConsultaCalificaciones'
+        :param table: tag of the rows inside NewDataSet e.g. 'CALIFICACIONES'
+        :param params: tuple of Param in the order of the method arguments
+        :param record: name of the record type
+        :param fields: fields always present in the records
+        :param converters: dict field -> callable that converts the string value
+        :param aliases: dict column tag -> field name
+        :param error: message of the AttributeError raised with invalid arguments
+        '''
+        self.method = method
+        self.operation = operation
+        self.table = table
+        self.params = tuple(params)
+        self.record = record
+        self.fields = tuple(fields)
+        self.converters = converters or {}
+        self.aliases = aliases or {}
+        self.error = error
+        self.__types = {}
+        self.__plans = {}
+
+    def bind(self, *args):
+        '''
+        Validate the arguments of the method
+        :return: dict with the parameters of the request
+        '''
+        if not all(param.check(arg) for param, arg in zip(self.params, args)):
+            raise AttributeError(self.error)
+        return {param.name: param.convert(arg) for param, arg in zip(self.params, args)}
+
+    def record_type(self, extras=()):
+        '''
+        :param extras: fields that are not declared in the schema
+        :return: namedtuple type with the declared fields plus the extras
+        '''
+        record_type = self.__types.get(extras)
+        if record_type is None:
+            fields = self.fields + extras
+            record_type = namedtuple(self.record, fields, defaults=(None,) * len(fields))
+            self.__types[extras] = record_type
+        return record_type
+
+    def names(self, columns):
+        '''
+        :param columns: column tags of a row
+        :return: list with the field of each column
+        '''
+        return [self.aliases.get(column) or field_name(column) for column in columns]
+
+    def __plan(self, columns, extras=None):
+        names = self.names(columns)
+        if extras is None:
+            extras = tuple(name for name in names if name not in self.fields)
+        record_type = self.record_type(extras)
+        positions = [record_type._fields.index(name) for name in names]
+        converters = [self.converters.get(name) for name in names]
+        steps = tuple(zip(positions, converters))
+        size = len(record_type._fields)
+        new = tuple.__new__
+
+        def extract(row):
+            values = [None] * size
+            for (position, converter), value in zip(steps, row.values()):
+                values[position] = converter(value) if converter is not None else value
+            return new(record_type, values)
+
+        self.__plans[columns, extras] = extract
+        return extract
+
+    def extract(self, rows):
+        '''
+        Turn parsed rows into records
+        :param rows: iterable of dicts column -> string
+        :return: list of records of one type
+        '''
+        rows = [(tuple(row), row) for row in rows]
+        layouts = dict.fromkeys(columns for columns, _ in rows)
+        extras = None
+        if len(layouts) > 1:
+            names = dict.fromkeys(name for columns in layouts for name in self.names(columns))
+            extras = tuple(name for name in names if name not in self.fields)
+        plans = self.__plans
+        records = []
+        for columns, row in rows:
+            plan = plans.get((columns, extras)) or self.__plan(columns, extras)
+            records.append(plan(row))
+        return records
+
+
+def is_code(value):
+    return value.isdigit()
+
+
+def is_course(value):
+    return value.isalnum()
+
+
+def is_user(value):
+    return value.isalpha()
+
+
+STUDENT = Param('codigoestudiante', is_code)
+COURSE = (Param('codigoMateria', is_course), Param('paralelo', is_code, int))
+STUDENT_ERROR = 'student code must be a string of numbers'
+
+# schemas shared by several operations, the values are kept as strings
+USER_FIELDS = ('USUARIO', 'CODESTUDIANTE', 'NOMBRES')
+COURSE_FIELDS = ('CODIGOMATERIA', 'NOMBRE', 'PARALELO', 'CREDITOS')
+STUDENT_FIELDS = ('CODESTUDIANTE', 'NOMBRES', 'APELLIDOS', 'IDENTIFICACION', 'CARRERA',
+                  'FACULTAD', 'PROMEDIOGENERAL')
+
+ENDPOINTS = {endpoint.method: endpoint for endpoint in (
+    Endpoint('ws_consultar_persona_nombres', 'wsConsultarPersonaPorNombres', 'DATOSPERSONA',
+             (Param('nombre', is_name), Param('apellido', is_name)), 'Person',
+             ('NOMBRES', 'APELLIDOS', 'CODESTUDIANTE'), error='name and lastname invalid'),
+    Endpoint('ws_consulta_calificaciones', 'wsConsultaCalificaciones', 'CALIFICACIONES',
+             (Param('anio', is_code), Param('termino', is_code), Param('estudiante', is_code)),
+             'Grade', ('MATERIA', 'NOTA1', 'NOTA2', 'NOTA3', 'PROMEDIO', 'ESTADO', 'VEZ'),
+             {'NOTA1': to_float, 'NOTA2': to_float, 'NOTA3': to_float, 'PROMEDIO': to_float,
+              'ESTADO': clean_text, 'VEZ': to_int}, error=STUDENT_ERROR),
+    Endpoint('ws_consulta_codigo_estudiante', 'wsConsultaCodigoEstudiante', 'MATRICULA',
+             (Param('user', is_user),), 'StudentCode', USER_FIELDS,
+             error='username is a string without numbers or special chars'),
+    Endpoint('ws_consulta_periodo_actual', 'wsConsultaPeriodoActual', 'PERIODO',
+             record='Period', fields=('ANIO', 'TERMINO', 'FECHAINICIO')),
+    # the name of the students comes in a column called _x0031_
+    Endpoint('ws_estudiantes_registrados', 'wsEstudiantesRegistrados', 'ESTUDIANTESREGISTRADOS',
+             COURSE, 'RegisteredStudent', ('CODESTUDIANTE', 'NOMBRE'),
+             aliases={'_x0031_': 'NOMBRE'}),
+    Endpoint('ws_horario_clases', 'wsHorarioClases', 'HORARIOCLASES', COURSE, 'ClassHour',
+             ('DIA', 'HORAINICIO', 'HORAFIN', 'AULA')),
+    Endpoint('ws_horario_examenes', 'wsHorarioExamenes', '_x0020__x0020_', COURSE, 'ExamDate',
+             ('TIPOEXAMEN', 'FECHA', 'HORAINICIO', 'HORAFIN')),
+    Endpoint('ws_materias_registradas', 'wsMateriasRegistradas', 'MATERIASREGISTRADAS',
+             (STUDENT,), 'RegisteredCourse', COURSE_FIELDS, error=STUDENT_ERROR),
+    Endpoint('ws_info_estudiante_general', 'wsInfoEstudianteGeneral', 'ESTUDIANTE',
+             (Param('codestudiante', is_code),), 'StudentGeneral', STUDENT_FIELDS,
+             error=STUDENT_ERROR),
+    Endpoint('ws_info_estudiante', 'wsInfoEstudiante', 'INFOESTUDIANTE',
+             (Param('codigoEstudiante', is_code),), 'StudentInfo', STUDENT_FIELDS,
+             error=STUDENT_ERROR),
+    Endpoint('ws_info_estudiante_carrera', 'wsInfoEstudianteCarrera', 'ESTUDIANTECARRERA',
+             (Param('codigoEstudiante', is_code),), 'StudentCareer', STUDENT_FIELDS,
+             error=STUDENT_ERROR),
+    Endpoint('ws_info_personal_estudiante', 'wsInfoPersonalEstudiante', 'INFOPERSONALESTUDIANTE',
+             (Param('matricula', is_code), Param('identificacion', is_code)), 'StudentPersonal',
+             STUDENT_FIELDS, error='student code or dni invalid'),
+    Endpoint('ws_info_usuario', 'wsInfoUsuario', 'INFORMACIONUSUARIO',
+             (Param('usuario', is_user),), 'UserInfo', USER_FIELDS, error='username incorrect'),
+    Endpoint('ws_info_paralelo', 'wsInfoparalelo', 'INFORMACIONMATERIA', COURSE, 'CourseInfo',
+             COURSE_FIELDS),
+    Endpoint('ws_materias_disponibles', 'wsMateriasDisponibles', 'MATERIASDISPONIBLES',
+             (STUDENT,), 'AvailableCourse', COURSE_FIELDS, error=STUDENT_ERROR),
+)}
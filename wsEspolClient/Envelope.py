@@ -0,0 +1,76 @@
+'''
+Precompiled SOAP request envelopes of Espol Web Services
+'''
+import re
+from xml.sax.saxutils import escape, unescape
+
+from pysimplesoap.client import SoapFault
+
+
+NAMESPACE = 'http://tempuri.org/'
+
+HEAD = ('<?xml version="1.0" encoding="UTF-8"?>'
+        '<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xmlns:xsd="http://www.w3.org/2001/XMLSchema" '
+        'xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+        '<soap:Header><GTSIAuthSoapHeader xmlns="{namespace}">'
+        '<usuario>{user}</usuario><key>{key}</key></GTSIAuthSoapHeader></soap:Header>'
+        '<soap:Body><{operation} xmlns="{namespace}">')
+TAIL = '</{operation}></soap:Body></soap:Envelope>'
+
+FAULT_STRING = re.compile(rb'<faultstring[^>]*>(.*?)</faultstring>', re.S)
+FAULT_CODE = re.compile(rb'<faultcode[^>]*>(.*?)</faultcode>', re.S)
+
+
+class Envelope():
+    '''
+    Envelope keeps the request of one operation, auth header included, as
+    byte pieces compiled once; each call only escapes and joins the values
+    of the parameters
+    '''
+
+    def __init__(self, operation, params, user, key):
+        '''
+        :param operation: name of the operation e.g. 'wsConsultaCalificaciones'
+        :param params: names of the parameters in order e.g. ('anio', 'termino')
+        :param user: user of the GTSIAuthSoapHeader
+        :param key: key of the GTSIAuthSoapHeader
+        '''
+        self.operation = operation
+        self.params = tuple(params)
+        self.action = NAMESPACE + operation
+        head = HEAD.format(namespace=NAMESPACE, operation=operation,
+                           user=escape(user), key=escape(key))
+        tail = TAIL.format(operation=operation)
+        pieces = []
+        for name in self.params:
+            pieces.append(head + '<{}>'.format(name))
+            head = '</{}>'.format(name)
+        pieces.append(head + tail)
+        self.__pieces = [piece.encode('utf-8') for piece in pieces]
+
+    def build(self, params):
+        '''
+        Fill the envelope
+        :param params: dict with the value of every parameter
+        :return: bytes of the request
+        '''
+        pieces = self.__pieces
+        chunks = [pieces[0]]
+        for index, name in enumerate(self.params):
+            chunks.append(escape(str(params[name])).encode('utf-8'))
+            chunks.append(pieces[index + 1])
+        return b''.join(chunks)
+
+
+def soap_fault(content):
+    '''
+    Build the exception of a failed response, the same pysimplesoap raises
+    :param content: bytes of the response
+    :return: SoapFault
+    '''
+    code = FAULT_CODE.search(content)
+    string = FAULT_STRING.search(content)
+    return SoapFault(unescape(code.group(1).decode('utf-8', 'replace')) if code else 'soap:Server',
+                     unescape(string.group(1).decode('utf-8', 'replace')) if string
+                     else content[:200].decode('utf-8', 'replace'))
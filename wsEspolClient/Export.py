@@ -0,0 +1,226 @@
+'''
+Streaming export of harvested data to NDJSON, CSV, Parquet or Arrow IPC
+'''
+import csv
+import json
+from collections import namedtuple
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from .Endpoints import ENDPOINTS, to_float, to_int
+
+
+Column = namedtuple('Column', 'name type')
+
+COURSE_COLUMNS = (Column('course', 'string'), Column('parallel', 'int64'))
+TERM_COLUMNS = (Column('student', 'string'), Column('year', 'int64'), Column('term', 'string'))
+
+CONVERTER_TYPES = {to_float: 'float64', to_int: 'int64'}
+
+
+def endpoint_columns(method):
+    '''
+    Columns of the records of an endpoint, typed by their converters
+    :param method: name of the endpoint e.g. 'ws_consulta_calificaciones'
+    :return: tuple of Column
+    '''
+    endpoint = ENDPOINTS[method]
+    return tuple(Column(field, CONVERTER_TYPES.get(endpoint.converters.get(field), 'string'))
+                 for field in endpoint.fields)
+
+
+SCHEMAS = {
+    'grades': TERM_COLUMNS + endpoint_columns('ws_consulta_calificaciones'),
+    'roster': COURSE_COLUMNS + endpoint_columns('ws_estudiantes_registrados'),
+    'class_hours': COURSE_COLUMNS + endpoint_columns('ws_horario_clases'),
+    'exam_dates': COURSE_COLUMNS + endpoint_columns('ws_horario_examenes'),
+}
+
+FORMATS = ('ndjson', 'csv', 'parquet', 'arrow')
+
+
+def open_output(path, **kwargs):
+    '''
+    :param path: output file or an open text stream e.g. sys.stdout
+    :return: tuple (stream, True if it was opened here and must be closed)
+    '''
+    if hasattr(path, 'write'):
+        return path, False
+    return open(path, 'w', encoding='utf-8', **kwargs), True
+
+
+class NdjsonWriter():
+    '''
+    NdjsonWriter writes one json object per row
+    '''
+
+    def __init__(self, path, schema):
+        self.schema = schema
+        self.__names = [column.name for column in schema]
+        self.__output, self.__owned = open_output(path)
+
+    def write(self, row):
+        '''
+        :param row: dict with the columns of the schema, other keys are ignored
+        '''
+        self.__output.write(json.dumps({name: row.get(name) for name in self.__names},
+                                       ensure_ascii=False) + '\n')
+
+    def flush(self):
+        self.__output.flush()
+
+    def close(self):
+        if self.__owned:
+            self.__output.close()
+
+
+class CsvWriter():
+    '''
+    CsvWriter writes a header with the schema and one line per row
+    '''
+
+    def __init__(self, path, schema):
+        self.schema = schema
+        self.__output, self.__owned = open_output(path, newline='')
+        self.__writer = csv.DictWriter(self.__output, [column.name for column in schema],
+                                       extrasaction='ignore')
+        self.__writer.writeheader()
+
+    def write(self, row):
+        self.__writer.writerow(row)
+
+    def flush(self):
+        self.__output.flush()
+
+    def close(self):
+        if self.__owned:
+            self.__output.close()
+
+
+class ArrowWriter():
+    '''
+    ArrowWriter buffers the rows column by column and writes a record batch
+    (a row group in parquet) every row_group_size rows, so memory does not
+    depend on the number of rows exported
+    '''
+
+    def __init__(self, path, schema, row_group_size=50000, parquet=False):
+        if pyarrow is None:
+            raise ImportError('pyarrow is required to export parquet or arrow files')
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.__names = [column.name for column in schema]
+        self.__arrow_schema = pyarrow.schema([(column.name, pyarrow.type_for_alias(column.type))
+                                              for column in schema])
+        if parquet:
+            self.__writer = pyarrow.parquet.ParquetWriter(path, self.__arrow_schema)
+        else:
+            self.__writer = pyarrow.ipc.new_file(path, self.__arrow_schema)
+        self.__columns = [[] for _ in self.__names]
+        self.__size = 0
+
+    def write(self, row):
+        for name, values in zip(self.__names, self.__columns):
+            values.append(row.get(name))
+        self.__size += 1
+        if self.__size >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.__size:
+            return
+        batch = pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array(values, type=field.type)
+             for values, field in zip(self.__columns, self.__arrow_schema)],
+            schema=self.__arrow_schema)
+        self.__writer.write_batch(batch)
+        self.__columns = [[] for _ in self.__names]
+        self.__size = 0
+
+    def close(self):
+        self.flush()
+        self.__writer.close()
+
+
+def writer(path, schema, fmt=None, row_group_size=50000):
+    '''
+    Open a writer
+    :param path: output file
+    :param schema: tuple of Column or name of a schema in SCHEMAS
+    :param fmt: one of FORMATS, by default taken from the file extension
+    :return: writer with write(row) and close()
+    '''
+    if isinstance(schema, str):
+        schema = SCHEMAS[schema]
+    fmt = fmt or path.rsplit('.', 1)[-1].lower()
+    if fmt in ('ndjson', 'jsonl'):
+        return NdjsonWriter(path, schema)
+    if fmt == 'csv':
+        return CsvWriter(path, schema)
+    if fmt in ('parquet', 'arrow'):
+        return ArrowWriter(path, schema, row_group_size, parquet=fmt == 'parquet')
+    raise ValueError('unknown format {}, use one of {}'.format(fmt, ', '.join(FORMATS)))
+
+
+def export(rows, path, schema, fmt=None, row_group_size=50000):
+    '''
+    Stream rows to a file
+    :param rows: iterable of dicts
+    :return: number of rows written
+    '''
+    output = writer(path, schema, fmt, row_group_size)
+    count = 0
+    try:
+        for row in rows:
+            output.write(row)
+            count += 1
+    finally:
+        output.close()
+    return count
+
+
+def grade_rows(client, students, terms):
+    '''
+    :param students: iterable of student ids
+    :param terms: iterable of tuples (year, term)
+    :return: generator of grade rows
+    '''
+    terms = list(terms)
+    for student in students:
+        for year, term in terms:
+            for grade in client.ws_consulta_calificaciones(year, term, student):
+                yield dict(grade._asdict(), student=student, year=int(year), term=term)
+
+
+def checkpoint_rows(path):
+    '''
+    Read the grades harvested by GradeHarvester
+    :param path: checkpoint json lines file
+    :return: generator of grade rows
+    '''
+    with open(path, encoding='utf-8') as lines:
+        for line in lines:
+            try:
+                unit = json.loads(line)
+            except ValueError:
+                continue
+            for grade in unit['grades']:
+                yield dict(grade, student=unit['student'], year=int(unit['year']),
+                           term=unit['term'])
+
+
+def course_rows(client, method, courses):
+    '''
+    Rows of an endpoint called for each course
+    :param method: 'ws_estudiantes_registrados', 'ws_horario_clases' or 'ws_horario_examenes'
+    :param courses: iterable of tuples (course_code, parallel)
+    :return: generator of rows with course and parallel
+    '''
+    for course_code, parallel in courses:
+        for record in getattr(client, method)(course_code, str(parallel)):
+            yield dict(record._asdict(), course=course_code, parallel=int(parallel))
@@ -0,0 +1,295 @@
+'''
+Local stand-in of Espol Web Services for benchmarks and load tests
+'''
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+
+SUBJECTS = ('CALCULO DE UNA VARIABLE', 'FISICA I', 'ALGEBRA LINEAL', 'ECUACIONES DIFERENCIALES',
+            'PROGRAMACION DE SISTEMAS', 'ESTRUCTURAS DE DATOS', 'QUIMICA GENERAL', 'ESTADISTICA')
+NAMES = ('JOSÉ ANDRÉS', 'MARÍA JOSÉ', 'OSCAR', 'ÁNGEL DAVID', 'NÚÑEZ', 'JOHN')
+LASTNAMES = ('DE LA OLLA', 'PÉREZ MUÑOZ', 'DOE', 'SALTOS ÁLVAREZ', 'IBÁÑEZ')
+DAYS = ('LUNES', 'MARTES', 'MIERCOLES', 'JUEVES', 'VIERNES')
+
+
+def _code(rnd):
+    return str(rnd.randint(200000000, 201999999))
+
+
+def _grades(rnd, index):
+    grades = [rnd.randint(0, 100) for _ in range(3)]
+    average = sum(sorted(grades)[1:]) / 2.0
+    return {'MATERIA': SUBJECTS[index % len(SUBJECTS)],
+            'NOTA1': '%.2f' % grades[0], 'NOTA2': '%.2f' % grades[1],
+            'NOTA3': '%.2f' % grades[2], 'PROMEDIO': '%.2f' % average,
+            'ESTADO': 'AP&nbsp;' if average >= 60 else 'RP&nbsp;',
+            'VEZ': str(rnd.randint(1, 3))}
+
+
+def _person(rnd, index):
+    return {'NOMBRES': rnd.choice(NAMES), 'APELLIDOS': rnd.choice(LASTNAMES),
+            'CODESTUDIANTE': _code(rnd), 'IDENTIFICACION': str(rnd.randint(900000000, 999999999))}
+
+
+def _registered(rnd, index):
+    return {'CODESTUDIANTE': _code(rnd),
+            '_x0031_': '{} {}'.format(rnd.choice(LASTNAMES), rnd.choice(NAMES))}
+
+
+def _class_hour(rnd, index):
+    start = rnd.randint(7, 18)
+    return {'DIA': DAYS[index % len(DAYS)], 'HORAINICIO': '%02d:30' % start,
+            'HORAFIN': '%02d:30' % (start + 2), 'AULA': 'A%d' % rnd.randint(100, 400)}
+
+
+def _exam(rnd, index):
+    start = rnd.randint(8, 16)
+    return {'TIPOEXAMEN': ('PARCIAL', 'FINAL', 'MEJORAMIENTO')[index % 3],
+            'FECHA': '2017-%02d-%02dT00:00:00-05:00' % (rnd.randint(6, 9), rnd.randint(1, 28)),
+            'HORAINICIO': '%02d:00' % start, 'HORAFIN': '%02d:00' % (start + 2)}
+
+
+def _subject(rnd, index):
+    return {'CODIGOMATERIA': 'ICM%05d' % rnd.randint(1, 999), 'NOMBRE': SUBJECTS[index % len(SUBJECTS)],
+            'PARALELO': str(rnd.randint(1, 6)), 'CREDITOS': str(rnd.randint(2, 5))}
+
+
+def _student(rnd, index):
+    return dict(_person(rnd, index), CARRERA='INGENIERIA EN COMPUTACION',
+                PROMEDIOGENERAL='%.2f' % rnd.uniform(5, 10), FACULTAD='FIEC')
+
+
+def _period(rnd, index):
+    return {'ANIO': '2017', 'TERMINO': '1', 'FECHAINICIO': '2017-05-02T00:00:00-05:00'}
+
+
+def _user(rnd, index):
+    return {'USUARIO': 'jdoe', 'CODESTUDIANTE': _code(rnd), 'NOMBRES': rnd.choice(NAMES)}
+
+
+OPERATIONS = {
+    'wsConsultarPersonaPorNombres': ('DATOSPERSONA', _person),
+    'wsConsultaCalificaciones': ('CALIFICACIONES', _grades),
+    'wsConsultaCodigoEstudiante': ('MATRICULA', _user),
+    'wsConsultaPeriodoActual': ('PERIODO', _period),
+    'wsEstudiantesRegistrados': ('ESTUDIANTESREGISTRADOS', _registered),
+    'wsHorarioClases': ('HORARIOCLASES', _class_hour),
+    'wsHorarioExamenes': ('_x0020__x0020_', _exam),
+    'wsMateriasRegistradas': ('MATERIASREGISTRADAS', _subject),
+    'wsInfoEstudianteGeneral': ('ESTUDIANTE', _student),
+    'wsInfoEstudiante': ('INFOESTUDIANTE', _student),
+    'wsInfoEstudianteCarrera': ('ESTUDIANTECARRERA', _student),
+    'wsInfoPersonalEstudiante': ('INFOPERSONALESTUDIANTE', _student),
+    'wsInfoUsuario': ('INFORMACIONUSUARIO', _user),
+    'wsInfoparalelo': ('INFORMACIONMATERIA', _subject),
+    'wsMateriasDisponibles': ('MATERIASDISPONIBLES', _subject),
+}
+
+PARAM = re.compile(rb'<(\w+)(?: [^>]*)?>([^<]*)</\1>')
+
+SINGLE_ROW = ('wsConsultaPeriodoActual', 'wsConsultaCodigoEstudiante', 'wsInfoEstudianteGeneral',
+              'wsInfoEstudiante', 'wsInfoEstudianteCarrera', 'wsInfoPersonalEstudiante',
+              'wsInfoUsuario')
+
+ENVELOPE = ('<?xml version="1.0" encoding="utf-8"?>'
+            '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" '
+            'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+            'xmlns:xsd="http://www.w3.org/2001/XMLSchema"><soap:Body>'
+            '<{operation}Response xmlns="http://tempuri.org/"><{operation}Result>'
+            '<xs:schema id="NewDataSet" xmlns="" xmlns:xs="http://www.w3.org/2001/XMLSchema" '
+            'xmlns:msdata="urn:schemas-microsoft-com:xml-msdata">'
+            '<xs:element name="NewDataSet" msdata:IsDataSet="true" msdata:UseCurrentLocale="true">'
+            '<xs:complexType><xs:choice minOccurs="0" maxOccurs="unbounded">'
+            '<xs:element name="{table}"><xs:complexType><xs:sequence>{columns}</xs:sequence>'
+            '</xs:complexType></xs:element></xs:choice></xs:complexType></xs:element></xs:schema>'
+            '<diffgr:diffgram xmlns:msdata="urn:schemas-microsoft-com:xml-msdata" '
+            'xmlns:diffgr="urn:schemas-microsoft-com:xml-diffgram-v1">'
+            '<NewDataSet xmlns="">{rows}</NewDataSet></diffgr:diffgram>'
+            '</{operation}Result></{operation}Response></soap:Body></soap:Envelope>')
+
+FAULT = ('<?xml version="1.0" encoding="utf-8"?>'
+         '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>'
+         '<soap:Fault><faultcode>soap:Server</faultcode>'
+         '<faultstring>Server was unable to process request. ---&gt; injected error'
+         '</faultstring><detail /></soap:Fault></soap:Body></soap:Envelope>')
+
+
+def diffgram(operation, rows):
+    '''
+    Build the diffgram envelope of a response
+    :param operation: name of the operation e.g. 'wsConsultaCalificaciones'
+    :param rows: list of dicts
+    :return: bytes of the response
+    '''
+    table = OPERATIONS[operation][0]
+    columns = ''.join('<xs:element name="{}" type="xs:string" minOccurs="0" />'.format(name)
+                      for name in (rows[0] if rows else ()))
+    body = ''.join(
+        '<{table} diffgr:id="{table}{id}" msdata:rowOrder="{order}">{fields}</{table}>'.format(
+            table=table, id=index + 1, order=index,
+            fields=''.join('<{0}>{1}</{0}>'.format(name, escape(value))
+                           for name, value in row.items() if value is not None))
+        for index, row in enumerate(rows))
+    return ENVELOPE.format(operation=operation, table=table, columns=columns,
+                           rows=body).encode('utf-8')
+
+
+def request_params(operation, body):
+    '''
+    :param body: bytes of a SOAP request
+    :return: tuple of tuples (name, value) with the parameters of the operation
+    '''
+    start = body.find(b'<' + operation.encode())
+    end = body.find(b'</' + operation.encode())
+    if start < 0 or end < 0:
+        return ()
+    return tuple((name.decode(), value.decode('utf-8', 'replace')) for name, value in
+                 PARAM.findall(body, start, end))
+
+
+class FakeServer():
+    '''
+    FakeServer answers every operation used by Client with generated
+    diffgram envelopes.
+
+    rows, latency and error_rate can be changed while the server runs:
+    rows is a number or a dict operation -> number, latency is seconds or a
+    tuple (min, max) and error_rate is the probability of a SOAP fault.
+    The rows only depend on the seed, the operation and its parameters, so
+    the same request always gets the same answer.
+    Responses are compressed when the request accepts gzip or deflate and
+    compression is enabled; connections counts the connections accepted.
+    '''
+
+    def __init__(self, host='127.0.0.1', port=0, rows=20, latency=0.0, error_rate=0.0, seed=None,
+                 compression=True):
+        self.rows = rows
+        self.latency = latency
+        self.error_rate = error_rate
+        self.compression = compression
+        self.requests = 0
+        self.connections = 0
+        self.seed = seed
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.__server = ThreadingHTTPServer((host, port), self.__handler())
+        self.__server.daemon_threads = True
+
+    @property
+    def location(self):
+        '''
+        :return: url to use as Client location
+        '''
+        host, port = self.__server.server_address[:2]
+        return 'http://{}:{}/saac/wsandroid.asmx'.format(host, port)
+
+    def row_count(self, operation):
+        if operation in SINGLE_ROW:
+            return 1
+        if isinstance(self.rows, dict):
+            return self.rows.get(operation, 20)
+        return self.rows
+
+    def delay(self):
+        if isinstance(self.latency, tuple):
+            return self.__random.uniform(*self.latency)
+        return self.latency
+
+    def respond(self, operation, params=()):
+        '''
+        Build the answer of an operation
+        :param params: tuple of tuples (name, value) of the request
+        :return: tuple (http status, bytes of the body)
+        '''
+        with self.__lock:
+            self.requests += 1
+            failed = self.__random.random() < self.error_rate
+        if failed:
+            return 500, FAULT.encode('utf-8')
+        # a string seed is hashed the same way on every run
+        rnd = random.Random(repr((self.seed, operation, tuple(params))))
+        make_row = OPERATIONS[operation][1]
+        return 200, diffgram(operation, [make_row(rnd, index)
+                                         for index in range(self.row_count(operation))])
+
+    def connected(self):
+        with self.__lock:
+            self.connections += 1
+
+    def encode(self, content, accepted):
+        '''
+        Compress a response with the first encoding accepted
+        :param accepted: value of the Accept-Encoding header
+        :return: tuple (encoding or None, bytes of the body)
+        '''
+        if self.compression:
+            encodings = [value.split(';')[0].strip() for value in accepted.split(',')]
+            if 'gzip' in encodings:
+                compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                return 'gzip', compressor.compress(content) + compressor.flush()
+            if 'deflate' in encodings:
+                return 'deflate', zlib.compress(content, 6)
+        return None, content
+
+    def __handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body are written apart, do not hold the body on kept-alive connections
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                fake.connected()
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                action = self.headers.get('SOAPAction', '').strip('"')
+                operation = action.rsplit('/', 1)[-1]
+                if operation not in OPERATIONS:
+                    match = re.search(rb'<(ws\w+) xmlns="http://tempuri.org/"', body)
+                    operation = match.group(1).decode() if match else None
+                if operation not in OPERATIONS:
+                    status, content = 500, FAULT.encode('utf-8')
+                else:
+                    time.sleep(fake.delay())
+                    status, content = fake.respond(operation, request_params(operation, body))
+                encoding, content = fake.encode(content, self.headers.get('Accept-Encoding', ''))
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/xml; charset=utf-8')
+                if encoding:
+                    self.send_header('Content-Encoding', encoding)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        '''
+        Serve in a background thread
+        :return: self
+        '''
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,201 @@
+'''
+Resumable harvester of the grades of the students registered in courses
+'''
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .Client import Client
+from .Pool import ThreadLocalClient, bounded
+
+
+STUDENT_CODE_FIELDS = ('CODESTUDIANTE', 'CODIGOESTUDIANTE', 'MATRICULA', 'CODIGO')
+
+
+def student_code(student):
+    '''
+    Find the student id in a RegisteredStudent record
+    :param student: record of wsEstudiantesRegistrados
+    :return: string with the student id or None
+    '''
+    for field in STUDENT_CODE_FIELDS:
+        if getattr(student, field, None):
+            return getattr(student, field)
+    for value in student:
+        if value and value.isdigit():
+            return value
+    return None
+
+
+def periods(first_year, last_year, terms=('1', '2')):
+    '''
+    Build the academic terms of a range of years
+    :return: list of tuples (year, term)
+    '''
+    return [(str(year), str(term))
+            for year in range(int(first_year), int(last_year) + 1) for term in terms]
+
+
+class Progress():
+    '''
+    Progress keeps the throughput and ETA of the harvest
+    '''
+
+    def __init__(self, total, done=0, stream=sys.stderr, every=2.0):
+        self.total = total
+        self.done = done
+        self.failed = 0
+        self.stream = stream
+        self.every = every
+        self.__started = time.monotonic()
+        self.__initial = done
+        self.__printed = 0.0
+
+    def rate(self):
+        '''
+        :return: units completed per second in this run
+        '''
+        elapsed = time.monotonic() - self.__started
+        return (self.done - self.__initial) / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        '''
+        :return: seconds left or None if unknown
+        '''
+        rate = self.rate()
+        return (self.total - self.done) / rate if rate > 0 else None
+
+    def update(self, done=0, failed=0, force=False):
+        self.done += done
+        self.failed += failed
+        now = time.monotonic()
+        if self.stream is not None and (force or now - self.__printed >= self.every):
+            self.__printed = now
+            eta = self.eta()
+            self.stream.write('{}/{} done, {} failed, {:.1f} units/s, ETA {}\n'.format(
+                self.done, self.total, self.failed, self.rate(),
+                '?' if eta is None else time.strftime('%H:%M:%S', time.gmtime(eta))))
+            self.stream.flush()
+
+
+class GradeHarvester():
+    '''
+    GradeHarvester enumerates the students of some courses with
+    wsEstudiantesRegistrados and fetches their grades of each term with
+    wsConsultaCalificaciones on a pool of workers.
+
+    Each completed (student, year, term) unit is appended as a json line to
+    the checkpoint file, so an interrupted harvest resumes where it stopped.
+    '''
+
+    def __init__(self, checkpoint, workers=8, client_factory=Client, progress_stream=sys.stderr):
+        '''
+        :param checkpoint: json lines file with the harvested grades
+        :param workers: number of concurrent calls
+        :param client_factory: callable that returns a new Client
+        :param progress_stream: stream for the progress report, None to disable it
+        '''
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.progress_stream = progress_stream
+        self.failed_courses = []
+        self.__client = ThreadLocalClient(client_factory)
+
+    def completed(self):
+        '''
+        Read the units already in the checkpoint
+        :return: set of tuples (student, year, term)
+        '''
+        done = set()
+        if not os.path.exists(self.checkpoint):
+            return done
+        with open(self.checkpoint, encoding='utf-8') as lines:
+            for line in lines:
+                try:
+                    unit = json.loads(line)
+                except ValueError:
+                    # last line of a crashed run
+                    continue
+                done.add((unit['student'], unit['year'], unit['term']))
+        return done
+
+    def __roster(self, course):
+        course_code, parallel = course
+        try:
+            students = self.__client().ws_estudiantes_registrados(course_code, str(parallel))
+        except Exception as error:
+            # the other courses are harvested, a run again retries this one
+            self.failed_courses.append(course)
+            if self.progress_stream is not None:
+                self.progress_stream.write('roster of {}:{} failed: {}: {}\n'.format(
+                    course_code, parallel, type(error).__name__, error))
+            return []
+        return [code for code in map(student_code, students) if code]
+
+    def students(self, courses, executor):
+        '''
+        Enumerate the students of the courses without duplicates, the courses
+        whose roster failed are kept in failed_courses
+        :param courses: list of tuples (course_code, parallel)
+        :return: list of student ids in order of appearance
+        '''
+        seen = {}
+        for codes in executor.map(self.__roster, courses):
+            for code in codes:
+                seen.setdefault(code, None)
+        return list(seen)
+
+    def __open(self):
+        '''
+        Open the checkpoint to append, after the line a crash may have left cut
+        '''
+        output = open(self.checkpoint, 'a', encoding='utf-8')
+        if output.tell() > 0:
+            with open(self.checkpoint, 'rb') as data:
+                data.seek(-1, os.SEEK_END)
+                if data.read(1) != b'\n':
+                    output.write('\n')
+        return output
+
+    def __grades(self, unit):
+        student, year, term = unit
+        grades = self.__client().ws_consulta_calificaciones(year, term, student)
+        return [grade._asdict() for grade in grades]
+
+    def run(self, courses, terms):
+        '''
+        Harvest the grades
+        :param courses: list of tuples (course_code, parallel)
+        :param terms: list of tuples (year, term)
+        :return: Progress of the harvest
+        '''
+        done = self.completed()
+        self.failed_courses = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            students = self.students(courses, executor)
+            units = ((student, year, term) for student in students for year, term in terms
+                     if (student, year, term) not in done)
+            # the checkpoint may have units of other courses or terms
+            finished = sum((student, year, term) in done
+                           for student in students for year, term in terms)
+            progress = Progress(len(students) * len(terms), finished, self.progress_stream)
+            with self.__open() as output:
+                try:
+                    # a bounded window of submitted units instead of one future per unit
+                    for unit, future in bounded(executor, self.__grades, units, self.workers * 4):
+                        self.__save(unit, future, output, progress)
+                finally:
+                    progress.update(force=True)
+        return progress
+
+    def __save(self, unit, future, output, progress):
+        student, year, term = unit
+        if future.exception() is not None:
+            progress.update(failed=1)
+            return
+        output.write(json.dumps({'student': student, 'year': year, 'term': term,
+                                 'grades': future.result()}) + '\n')
+        output.flush()
+        progress.update(done=1)
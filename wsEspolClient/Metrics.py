@@ -0,0 +1,172 @@
+'''
+Instrumentation of the calls to Espol Web Services
+'''
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PHASES = ('build', 'network', 'receive', 'parse', 'cleanup', 'total')
+
+
+class Trace():
+    '''
+    Trace collects the phases of one call
+    :phases: dict phase -> seconds; build, network (waiting the response),
+    receive (reading the body), parse and cleanup. A call answered by the
+    cache has no network phases
+    '''
+    __slots__ = ('method', 'phases', 'rows', 'request_bytes', 'response_bytes', 'error',
+                 'started', '__last')
+
+    def __init__(self, method):
+        self.method = method
+        self.phases = {}
+        self.rows = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.error = None
+        self.started = self.__last = time.perf_counter()
+
+    def lap(self, phase):
+        '''
+        Close a phase, it lasts since the previous one finished
+        :param phase: one of PHASES
+        '''
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self.__last
+        self.__last = now
+
+    def finish(self):
+        self.phases['total'] = time.perf_counter() - self.started
+
+    @property
+    def cached(self):
+        return self.error is None and 'network' not in self.phases
+
+
+class Histogram():
+    '''
+    Histogram with fixed buckets, the counts are made cumulative on export
+    '''
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics():
+    '''
+    Metrics aggregates the traces of the ws_* calls in histograms and
+    counters, calls the hooks registered for every trace and dumps
+    everything in the Prometheus text format.
+
+    Pass it to Client(metrics=...); a Client without metrics does not
+    trace anything.
+    '''
+
+    def __init__(self, buckets=BUCKETS, prefix='wsespol'):
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        self.hooks = []
+        self.__lock = threading.Lock()
+        self.__histograms = {}
+        self.__counters = defaultdict(int)
+
+    def add_hook(self, hook):
+        '''
+        :param hook: callable that receives every finished Trace
+        '''
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def start(self, method):
+        '''
+        :param method: name of the Client method
+        :return: Trace of the call
+        '''
+        return Trace(method)
+
+    def record(self, trace):
+        '''
+        Aggregate a finished Trace
+        '''
+        trace.finish()
+        method = trace.method
+        with self.__lock:
+            for phase, seconds in trace.phases.items():
+                histogram = self.__histograms.get((method, phase))
+                if histogram is None:
+                    histogram = self.__histograms[(method, phase)] = Histogram(self.buckets)
+                histogram.observe(seconds)
+            counters = self.__counters
+            counters[('calls_total', method, 'error' if trace.error else 'ok')] += 1
+            if trace.error:
+                counters[('errors_total', method, trace.error)] += 1
+            elif trace.cached:
+                counters[('cached_calls_total', method, None)] += 1
+            counters[('rows_total', method, None)] += trace.rows
+            counters[('request_bytes_total', method, None)] += trace.request_bytes
+            counters[('response_bytes_total', method, None)] += trace.response_bytes
+        for hook in self.hooks:
+            hook(trace)
+
+    def histogram(self, method, phase):
+        '''
+        :return: Histogram of a phase of a method or None
+        '''
+        return self.__histograms.get((method, phase))
+
+    def counter(self, name, method, label=None):
+        '''
+        :param name: e.g. 'calls_total', 'rows_total', 'response_bytes_total'
+        :param label: outcome for calls_total, exception name for errors_total
+        '''
+        return self.__counters.get((name, method, label), 0)
+
+    def prometheus(self):
+        '''
+        :return: string with the metrics in the Prometheus text format
+        '''
+        lines = []
+        name = '{}_phase_seconds'.format(self.prefix)
+        lines.append('# HELP {} Seconds spent in each phase of the calls'.format(name))
+        lines.append('# TYPE {} histogram'.format(name))
+        with self.__lock:
+            histograms = sorted(self.__histograms.items())
+            counters = sorted(self.__counters.items(), key=lambda item: tuple(map(str, item[0])))
+            for (method, phase), histogram in histograms:
+                labels = 'method="{}",phase="{}"'.format(method, phase)
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, bound,
+                                                                     cumulative))
+                lines.append('{}_sum{{{}}} {}'.format(name, labels, histogram.sum))
+                lines.append('{}_count{{{}}} {}'.format(name, labels, histogram.count))
+        described = set()
+        for (counter, method, label), value in counters:
+            name = '{}_{}'.format(self.prefix, counter)
+            if name not in described:
+                described.add(name)
+                lines.append('# TYPE {} counter'.format(name))
+            labels = 'method="{}"'.format(method)
+            if counter == 'calls_total':
+                labels += ',outcome="{}"'.format(label)
+            elif counter == 'errors_total':
+                labels += ',exception="{}"'.format(label)
+            lines.append('{}{{{}}} {}'.format(name, labels, value))
+        return '\n'.join(lines) + '\n'
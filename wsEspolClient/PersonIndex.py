@@ -0,0 +1,253 @@
+'''
+Local fuzzy index of the people returned by wsConsultarPersonaPorNombres
+'''
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+from .Endpoints import ENDPOINTS
+
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.wsSp1d3r', 'people.json')
+VERSION = 1
+
+NOT_ALPHANUMERIC = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    '''
+    Remove accents, case and punctuation
+    :param text: string e.g. 'Oscar De la Olla'
+    :return: list of tokens e.g. ['oscar', 'de', 'la', 'olla']
+    '''
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return NOT_ALPHANUMERIC.sub(' ', text.casefold()).split()
+
+
+def trigrams(token):
+    '''
+    :param token: normalized token e.g. 'olla'
+    :return: set of trigrams e.g. {' ol', 'oll', 'lla', 'la '}
+    '''
+    padded = ' {} '.format(token)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PersonIndex():
+    '''
+    PersonIndex keeps every DATOSPERSONA row seen with an inverted index of
+    tokens and trigrams for accent insensitive fuzzy matching ranked by
+    score, and the people the web service returned for each query, so the
+    same query is answered locally. It may be shared by threads.
+    '''
+
+    def __init__(self, path=DEFAULT_PATH, save_every=100):
+        '''
+        :param path: json file of the index
+        :param save_every: people or queries changed before checkpoint writes the file
+        '''
+        self.path = path
+        self.save_every = save_every
+        self.dirty = False
+        self.changes = 0
+        self.__lock = threading.RLock()
+        self.__people = []
+        self.__ids = {}
+        self.__tokens = {}
+        self.__trigrams = {}
+        self.__queries = {}
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH, save_every=100):
+        '''
+        Load an index from disk, an empty index if the file does not exist
+        '''
+        index = cls(path, save_every)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as data:
+                stored = json.load(data)
+            if stored.get('version') == VERSION:
+                index.__people = stored['people']
+                index.__tokens = stored['tokens']
+                index.__trigrams = stored['trigrams']
+                index.__queries = stored.get('queries', {})
+                index.__ids = {index.key(person): position
+                               for position, person in enumerate(index.__people)
+                               if person is not None}
+        return index
+
+    def save(self):
+        '''
+        Write the index to disk if it changed
+        '''
+        with self.__lock:
+            if not self.dirty:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as output:
+                json.dump({'version': VERSION, 'people': self.__people, 'tokens': self.__tokens,
+                           'trigrams': self.__trigrams, 'queries': self.__queries}, output,
+                          separators=(',', ':'))
+            os.replace(tmp, self.path)
+            self.dirty = False
+            self.changes = 0
+
+    def checkpoint(self):
+        '''
+        Write the index to disk once save_every people or queries changed since the last
+        write, the rest are written by save e.g. when the program ends
+        '''
+        with self.__lock:
+            if self.changes >= self.save_every:
+                self.save()
+
+    def __len__(self):
+        return len(self.__ids)
+
+    @staticmethod
+    def key(person):
+        return person.get('CODESTUDIANTE') or '{} {}'.format(person.get('NOMBRES'),
+                                                             person.get('APELLIDOS'))
+
+    @staticmethod
+    def tokens(person):
+        return set(normalize(person.get('NOMBRES')) + normalize(person.get('APELLIDOS')))
+
+    def add(self, person):
+        '''
+        Add or update a person
+        :param person: dict with the fields of a Person record
+        :return: True if the index changed
+        '''
+        with self.__lock:
+            key = self.key(person)
+            position = self.__ids.get(key)
+            if position is not None:
+                if self.__people[position] == person:
+                    return False
+                self.__unlink(position)
+            position = len(self.__people)
+            self.__people.append(person)
+            self.__ids[key] = position
+            grams = set()
+            for token in self.tokens(person):
+                self.__tokens.setdefault(token, []).append(position)
+                grams |= trigrams(token)
+            for gram in grams:
+                self.__trigrams.setdefault(gram, []).append(position)
+            self.dirty = True
+            self.changes += 1
+            return True
+
+    def update(self, people):
+        '''
+        Add the rows of a wsConsultarPersonaPorNombres response
+        :param people: list of Person records
+        :return: number of people added or updated
+        '''
+        with self.__lock:
+            return sum(self.add(person._asdict()) for person in people)
+
+    def __unlink(self, position):
+        person = self.__people[position]
+        grams = set()
+        for token in self.tokens(person):
+            self.__tokens[token].remove(position)
+            grams |= trigrams(token)
+        for gram in grams:
+            self.__trigrams[gram].remove(position)
+        # positions are kept stable, the old row is left as a hole
+        self.__people[position] = None
+
+    @staticmethod
+    def query_key(name, lastname):
+        '''
+        :return: the query normalized e.g. 'oscar|de la olla'
+        '''
+        return '{}|{}'.format(' '.join(normalize(name)), ' '.join(normalize(lastname)))
+
+    def remember(self, name, lastname, people):
+        '''
+        Keep the people the web service returned for a query, they must be
+        in the index already
+        :param people: list of Person records in the order to answer them
+        '''
+        with self.__lock:
+            keys = [self.key(person._asdict()) for person in people]
+            query = self.query_key(name, lastname)
+            if self.__queries.get(query) != keys:
+                self.__queries[query] = keys
+                self.dirty = True
+                self.changes += 1
+
+    def answer(self, name, lastname):
+        '''
+        People the web service returned for the same query before
+        :return: list of people, None if the query was not resolved remotely
+        '''
+        with self.__lock:
+            keys = self.__queries.get(self.query_key(name, lastname))
+            if keys is None or any(key not in self.__ids for key in keys):
+                return None
+            return [self.__people[self.__ids[key]] for key in keys]
+
+    def search(self, query, limit=10, min_score=0.5):
+        '''
+        Search people by names and lastnames
+        :param query: string e.g. 'oscar de la olla'
+        :param limit: max number of results, None for all
+        :param min_score: min score between 0 and 1
+        :return: list of tuples (score, person) sorted by score
+        '''
+        words = set(normalize(query))
+        if not words:
+            return []
+        with self.__lock:
+            exact = Counter()
+            for word in words:
+                exact.update(self.__tokens.get(word, ()))
+            grams = set()
+            for word in words:
+                grams |= trigrams(word)
+            fuzzy = Counter()
+            for gram in grams:
+                fuzzy.update(self.__trigrams.get(gram, ()))
+            results = []
+            for position, shared in fuzzy.items():
+                # exact tokens weight more than shared trigrams
+                score = 0.6 * exact[position] / len(words) + 0.4 * shared / len(grams)
+                if score >= min_score:
+                    results.append((round(score, 4), self.__people[position]))
+        results.sort(key=lambda result: result[0], reverse=True)
+        return results[:limit]
+
+
+def search_people(client, index, name, lastname):
+    '''
+    Search people in the local index, it answers only a query the web service
+    resolved before, ignoring accents, case and punctuation. Otherwise the
+    web service is asked, the people it returns are kept in the index and
+    ranked by how well the index matches them.
+    :param client: Client used when the query was not resolved before
+    :param index: PersonIndex
+    :return: list of Person records
+    '''
+    people = index.answer(name, lastname)
+    if people is not None:
+        return ENDPOINTS['ws_consultar_persona_nombres'].extract(people)
+    people = client.ws_consultar_persona_nombres(name, lastname)
+    index.update(people)
+    # the fuzzy matches only order the answer of the web service
+    scores = {index.key(person): score for score, person in
+              index.search('{} {}'.format(name, lastname), limit=None, min_score=0)}
+    people = sorted(people, key=lambda person: -scores.get(index.key(person._asdict()), 0))
+    if people:
+        # an empty answer is asked again, the person may be registered later
+        index.remember(name, lastname, people)
+    index.checkpoint()
+    return people
@@ -0,0 +1,58 @@
+'''
+Helpers of the jobs that call Espol Web Services on a pool of threads
+'''
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+
+
+class ThreadLocalClient():
+    '''
+    ThreadLocalClient gives every thread its own client, created on the
+    first call of that thread, since a Client keeps the state of the last
+    request and must not be shared by threads
+    '''
+
+    def __init__(self, client_factory):
+        '''
+        :param client_factory: callable that returns a new client e.g. Client
+        '''
+        self.client_factory = client_factory
+        self.__local = threading.local()
+
+    def __call__(self):
+        '''
+        :return: the client of the current thread
+        '''
+        client = getattr(self.__local, 'client', None)
+        if client is None:
+            client = self.__local.client = self.client_factory()
+        return client
+
+
+def bounded(executor, function, items, window):
+    '''
+    Run a function over the items keeping at most window of them submitted,
+    so the memory does not depend on the number of items. The items are read
+    lazily and the pending ones are cancelled when the generator is closed or
+    fails.
+    :param executor: ThreadPoolExecutor
+    :param items: iterable of arguments of function
+    :param window: max number of futures submitted e.g. 4 times the workers
+    :return: generator of tuples (item, future) in order of completion
+    '''
+    running = {}
+    items = iter(items)
+    try:
+        while True:
+            for item in items:
+                running[executor.submit(function, item)] = item
+                if len(running) >= window:
+                    break
+            if not running:
+                return
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield running.pop(future), future
+    except BaseException:
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
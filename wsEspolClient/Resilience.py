@@ -0,0 +1,259 @@
+'''
+Resilience layer for the calls to Espol Web Services: adaptive concurrency,
+a rate limit shared by processes, retries with jittered backoff and a
+circuit breaker
+'''
+import functools
+import http.client
+import multiprocessing
+import random
+import threading
+import time
+
+from pysimplesoap.client import SoapFault
+
+from .Client import Client
+from .Transport import PooledTransport
+
+
+# every ws_* operation is a query, so they are all safe to retry
+RETRIABLE = (OSError, http.client.HTTPException, SoapFault)
+
+
+class CircuitOpenError(Exception):
+    '''
+    The web service failed too many times in a row, calls are rejected
+    until the breaker lets a trial call through
+    '''
+
+
+class AdaptiveLimiter():
+    '''
+    AdaptiveLimiter bounds the calls in flight with an AIMD limit: it grows
+    by one every limit successful calls while the limit is used, and it is
+    cut by backoff on errors or when the recent latency (fast moving
+    average) goes over tolerance times the usual one (slow moving average)
+    '''
+
+    def __init__(self, initial=4, minimum=1, maximum=64, backoff=0.5, tolerance=2.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.inflight = 0
+        self.recent_latency = None
+        self.usual_latency = None
+        self.__decreased = 0.0
+        self.__condition = threading.Condition()
+
+    def acquire(self):
+        '''
+        Wait until a call may start
+        '''
+        with self.__condition:
+            while self.inflight >= int(self.limit):
+                self.__condition.wait()
+            self.inflight += 1
+
+    def release(self, latency=None, ok=True):
+        '''
+        Finish a call and adapt the limit
+        :param latency: seconds of the call, None if it never reached the web service
+        :param ok: False if the call failed
+        '''
+        with self.__condition:
+            saturated = self.inflight >= int(self.limit)
+            self.inflight -= 1
+            self.__condition.notify_all()
+            if latency is None:
+                return
+            if ok:
+                if self.usual_latency is None:
+                    self.recent_latency = self.usual_latency = latency
+                else:
+                    self.recent_latency += 0.3 * (latency - self.recent_latency)
+                    self.usual_latency += 0.02 * (latency - self.usual_latency)
+            now = time.monotonic()
+            slow = ok and self.recent_latency > self.tolerance * self.usual_latency
+            if not ok or slow:
+                # cut once per round-trip, not once per call of the same burst
+                if now - self.__decreased > latency:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self.__decreased = now
+            elif saturated:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+
+class SharedRateLimiter():
+    '''
+    SharedRateLimiter spaces the calls of every process that shares it to
+    rate per second, with bursts of up to burst calls. The time the next call
+    is due is kept in shared memory, so the limiter may be passed to worker
+    processes and used as the limiter of their ResilientClient.
+    '''
+
+    def __init__(self, rate, burst=1, context=None):
+        '''
+        :param rate: calls per second of all the processes together
+        :param burst: calls allowed at once after an idle period
+        :param context: multiprocessing context of the worker processes
+        '''
+        if rate <= 0 or burst < 1:
+            raise AttributeError('rate must be positive and burst at least 1')
+        self.interval = 1.0 / rate
+        self.burst = burst
+        self.__due = (context or multiprocessing).Value('d', 0.0)
+
+    def acquire(self):
+        '''
+        Wait until the call fits in the rate
+        '''
+        with self.__due.get_lock():
+            now = time.monotonic()
+            start = max(now, self.__due.value)
+            self.__due.value = start + self.interval
+        delay = start - now - (self.burst - 1) * self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+    def release(self, latency=None, ok=True):
+        pass
+
+
+class CircuitBreaker():
+    '''
+    CircuitBreaker opens after failure_threshold consecutive failures, rejects
+    calls during reset_timeout seconds and then lets one trial call through:
+    a success closes it again, a failure opens it for another period
+    '''
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.__opened = 0.0
+        self.__trial = False
+        self.__lock = threading.Lock()
+
+    def allow(self):
+        '''
+        :return: True if a call may go to the web service
+        '''
+        with self.__lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.__opened >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.__trial = False
+            if self.state == self.HALF_OPEN and not self.__trial:
+                self.__trial = True
+                return True
+            return False
+
+    def cancel(self):
+        '''
+        The call allowed never reached the web service, free the trial
+        '''
+        with self.__lock:
+            self.__trial = False
+
+    def success(self):
+        with self.__lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self.__lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.__opened = time.monotonic()
+
+
+def backoff(attempt, base=0.2, cap=10.0):
+    '''
+    Full jitter exponential backoff
+    :param attempt: number of the failed attempt, from 0
+    :return: seconds to sleep
+    '''
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _method(name):
+    @functools.wraps(getattr(Client, name))
+    def method(self, *args):
+        return self.call(name, *args)
+    return method
+
+
+class ResilientClient():
+    '''
+    ResilientClient wraps a Client: every ws_* call waits for the limiter,
+    is retried with jittered backoff on network errors and SOAP faults, and
+    is rejected with CircuitOpenError while the breaker is open.
+
+    The limiter and the breaker may be shared by the clients of every worker
+    of a bulk job, see resilient_factory.
+    '''
+
+    def __init__(self, client=None, limiter=None, breaker=None, retries=3,
+                 backoff_base=0.2, backoff_cap=10.0):
+        self.client = client if client is not None else Client()
+        self.limiter = limiter if limiter is not None else AdaptiveLimiter()
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+    def call(self, name, *args):
+        '''
+        Call a Client method with the resilience policies
+        :param name: name of the method e.g. 'ws_consulta_calificaciones'
+        '''
+        method = getattr(self.client, name)
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError('{} rejected, the web service is failing'.format(name))
+            self.limiter.acquire()
+            started = time.monotonic()
+            try:
+                result = method(*args)
+            except RETRIABLE:
+                self.limiter.release(time.monotonic() - started, False)
+                self.breaker.failure()
+                if attempt == self.retries:
+                    raise
+                time.sleep(backoff(attempt, self.backoff_base, self.backoff_cap))
+            except Exception:
+                # invalid arguments are not a failure of the web service
+                self.limiter.release()
+                self.breaker.cancel()
+                raise
+            else:
+                self.limiter.release(time.monotonic() - started, True)
+                self.breaker.success()
+                return result
+
+
+for _name in dir(Client):
+    if _name.startswith('ws_'):
+        setattr(ResilientClient, _name, _method(_name))
+
+
+def resilient_factory(workers):
+    '''
+    Client factory of a bulk job: the clients share an adaptive limiter that
+    starts with a few calls at once, a circuit breaker and a pool of
+    connections, so the job goes as fast as the web service allows
+    :param workers: number of threads that will use the clients
+    :return: callable that returns a new ResilientClient
+    '''
+    limiter = AdaptiveLimiter(initial=min(4, workers), maximum=workers)
+    breaker = CircuitBreaker()
+    transport = PooledTransport(max_connections=workers)
+    return lambda: ResilientClient(Client(transport=transport), limiter, breaker)
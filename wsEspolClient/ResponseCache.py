@@ -0,0 +1,212 @@
+'''
+Persistent cache of Espol Web Services responses
+'''
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.wsSp1d3r', 'cache.sqlite3')
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+
+def grades_ttl(cache, params):
+    '''
+    Grades of past terms never change, grades of the current term do
+    :param cache: ResponseCache asking for the policy
+    :param params: parameters of wsConsultaCalificaciones
+    :return: None for past terms, some minutes otherwise
+    '''
+    period = (int(params['anio']), int(params['termino']))
+    if cache.current_period is not None:
+        if period < tuple(int(item) for item in cache.current_period):
+            return None
+    elif period[0] < datetime.date.today().year - 1:
+        return None
+    return 10 * MINUTE
+
+
+DEFAULT_POLICIES = {
+    'wsConsultaPeriodoActual': DAY,
+    'wsConsultaCalificaciones': grades_ttl,
+    'wsConsultarPersonaPorNombres': DAY,
+    'wsConsultaCodigoEstudiante': None,
+    'wsHorarioClases': DAY,
+    'wsHorarioExamenes': DAY,
+    'wsInfoparalelo': DAY,
+    'wsEstudiantesRegistrados': HOUR,
+    'wsMateriasRegistradas': HOUR,
+    'wsMateriasDisponibles': HOUR,
+}
+
+
+class ResponseCache():
+    '''
+    ResponseCache keeps the parsed rows of each operation in a SQLite file,
+    keyed by the operation and its normalized parameters.
+
+    Every operation has a ttl policy: seconds, None (never expires),
+    0 (not cached) or a callable(cache, params) returning one of them.
+    The least recently used entries are evicted above max_entries.
+    '''
+
+    def __init__(self, path=DEFAULT_PATH, policies=None, default_ttl=HOUR,
+                 max_entries=100000, current_period=None):
+        '''
+        :param path: sqlite file, ':memory:' keeps the cache in memory
+        :param policies: dict operation -> ttl, merged over DEFAULT_POLICIES
+        :param default_ttl: ttl of the operations without policy
+        :param max_entries: max number of responses stored
+        :param current_period: tuple (year, term) of the current academic term
+        '''
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.policies = dict(DEFAULT_POLICIES)
+        self.policies.update(policies or {})
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.current_period = current_period
+        self.hits = Counter()
+        self.misses = Counter()
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.__db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        self.__db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                          'key TEXT PRIMARY KEY, operation TEXT, value TEXT, '
+                          'expires REAL, accessed REAL)')
+        self.__db.execute('CREATE INDEX IF NOT EXISTS responses_accessed '
+                          'ON responses (accessed)')
+        self.__entries = self.__db.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    @staticmethod
+    def key(operation, params):
+        '''
+        Build the key of a call
+        :param operation: name of the operation e.g. 'wsConsultaCalificaciones'
+        :param params: dict with the parameters of the operation
+        :return: string key
+        '''
+        normalized = sorted((name, str(value).strip().upper()) for name, value in params.items())
+        return operation + json.dumps(normalized, separators=(',', ':'))
+
+    def ttl(self, operation, params):
+        '''
+        Resolve the ttl policy of a call
+        :return: seconds, None if the entry never expires
+        '''
+        policy = self.policies.get(operation, self.default_ttl)
+        if callable(policy):
+            return policy(self, params)
+        return policy
+
+    def cached(self, operation, params, fetch):
+        '''
+        Return the cached response of a call or fetch and store it
+        :param operation: name of the operation
+        :param params: dict with the parameters of the operation
+        :param fetch: callable without arguments that consumes the web service
+        :return: the response
+        '''
+        if getattr(self.__local, 'bypass', False):
+            return fetch()
+        key = self.key(operation, params)
+        with self.__lock:
+            if not getattr(self.__local, 'refresh', False):
+                row = self.__db.execute('SELECT value, expires FROM responses WHERE key = ?',
+                                        (key,)).fetchone()
+                now = time.time()
+                if row is not None and (row[1] is None or row[1] > now):
+                    self.__db.execute('UPDATE responses SET accessed = ? WHERE key = ?',
+                                      (now, key))
+                    self.hits[operation] += 1
+                    return json.loads(row[0])
+            # the counters are shared by the threads, += is not atomic
+            self.misses[operation] += 1
+        value = fetch()
+        ttl = self.ttl(operation, params)
+        if ttl != 0:
+            self.__store(key, operation, value, ttl)
+        return value
+
+    def __store(self, key, operation, value, ttl):
+        now = time.time()
+        expires = None if ttl is None else now + ttl
+        with self.__lock:
+            self.__db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                              (key, operation, json.dumps(value), expires, now))
+            # replaced keys are counted too, __evict recounts the real number
+            self.__entries += 1
+            if self.__entries > self.max_entries:
+                self.__evict(now)
+
+    def __evict(self, now):
+        # drop the expired entries first, then the least recently used ones
+        self.__db.execute('DELETE FROM responses WHERE expires IS NOT NULL AND expires <= ?',
+                          (now,))
+        self.__entries = self.__db.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        overflow = self.__entries - self.max_entries
+        if overflow > 0:
+            self.__db.execute('DELETE FROM responses WHERE key IN (SELECT key FROM responses '
+                              'ORDER BY accessed LIMIT ?)', (overflow,))
+            self.__entries -= overflow
+
+    @contextmanager
+    def bypass(self):
+        '''
+        Calls inside this block neither read nor write the cache
+        '''
+        self.__local.bypass = True
+        try:
+            yield self
+        finally:
+            self.__local.bypass = False
+
+    @contextmanager
+    def refresh(self):
+        '''
+        Calls inside this block go to the web service and overwrite the cache
+        '''
+        self.__local.refresh = True
+        try:
+            yield self
+        finally:
+            self.__local.refresh = False
+
+    def invalidate(self, operation=None):
+        '''
+        Remove the entries of an operation, or every entry
+        :param operation: name of the operation, None removes everything
+        '''
+        with self.__lock:
+            if operation is None:
+                self.__db.execute('DELETE FROM responses')
+            else:
+                self.__db.execute('DELETE FROM responses WHERE operation = ?', (operation,))
+            self.__entries = self.__db.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def stats(self):
+        '''
+        :return: dict with hits, misses and entries stored
+        '''
+        with self.__lock:
+            return {
+                'hits': sum(self.hits.values()),
+                'misses': sum(self.misses.values()),
+                'entries': self.__entries,
+                'operations': {operation: {'hits': self.hits[operation],
+                                           'misses': self.misses[operation]}
+                               for operation in set(self.hits) | set(self.misses)},
+            }
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
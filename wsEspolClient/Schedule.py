@@ -0,0 +1,354 @@
+'''
+Conflict free schedules from the timetables of the course parallels
+'''
+import heapq
+import re
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .Client import Client
+from .Pool import ThreadLocalClient
+
+
+COURSE_FIELDS = ('CODIGOMATERIA', 'CODMATERIA', 'CODIGO', 'MATERIA')
+PARALLEL_FIELDS = ('PARALELO', 'PARALELOS')
+
+TIME = re.compile(r'(\d{1,2}):(\d{2})')
+
+# day is the weekday of a class or the date of an exam, start and end are minutes
+Meeting = namedtuple('Meeting', 'day start end')
+Section = namedtuple('Section', 'course parallel classes exams')
+Schedule = namedtuple('Schedule', 'score sections skipped')
+
+
+def minutes(value):
+    '''
+    :param value: time e.g. '07:30', '07:30:00' or '1900-01-01T07:30:00'
+    :return: minutes since midnight or None
+    '''
+    # the time of a timestamp follows the T, a zone offset may come after it
+    found = TIME.search((value or '').rpartition('T')[2])
+    if found is None:
+        return None
+    return int(found.group(1)) * 60 + int(found.group(2))
+
+
+def meetings(records, day_field, date=False):
+    '''
+    :param records: ClassHour or ExamDate records
+    :param day_field: 'DIA' or 'FECHA'
+    :param date: keep only the date of the day field
+    :return: list of Meeting, the records without day or times are ignored
+    '''
+    found = []
+    for record in records:
+        day = getattr(record, day_field)
+        start, end = minutes(record.HORAINICIO), minutes(record.HORAFIN)
+        if not day or start is None or end is None:
+            continue
+        found.append(Meeting(day[:10] if date else day.strip().upper(), start, end))
+    return found
+
+
+def _field(record, fields):
+    values = record._asdict()
+    return next((str(values[field]).strip() for field in fields if values.get(field)), None)
+
+
+def available_courses(client, student, max_parallels=6):
+    '''
+    Parallels a student may enroll in
+    :param client: Client
+    :param student: student id
+    :param max_parallels: parallels tried for a course listed without them
+    :return: list of tuples (course_code, parallel)
+    '''
+    courses = []
+    for record in client.ws_materias_disponibles(student):
+        course = _field(record, COURSE_FIELDS)
+        parallel = _field(record, PARALLEL_FIELDS)
+        if not course:
+            continue
+        if parallel and parallel.isdigit():
+            courses.append((course, parallel))
+        else:
+            # parallels without classes are dropped by fetch_sections
+            courses.extend((course, str(number)) for number in range(1, max_parallels + 1))
+    return list(dict.fromkeys(courses))
+
+
+def fetch_sections(courses, workers=8, client_factory=Client, errors=None):
+    '''
+    Get the class and exam timetables of many parallels concurrently
+    :param courses: iterable of tuples (course_code, parallel)
+    :param errors: list that collects tuples (course_code, parallel, error) of the
+    parallels whose timetables failed, they are left out as well
+    :return: list of Section, parallels without classes are left out
+    '''
+    client_of_thread = ThreadLocalClient(client_factory)
+
+    def fetch(course):
+        client = client_of_thread()
+        course_code, parallel = course
+        try:
+            classes = meetings(client.ws_horario_clases(course_code, str(parallel)), 'DIA')
+            if not classes:
+                return None
+            exams = meetings(client.ws_horario_examenes(course_code, str(parallel)), 'FECHA',
+                             True)
+        except Exception as error:
+            # parallels up to max_parallels are tried, some of them may not exist
+            if errors is not None:
+                errors.append((course_code, str(parallel), error))
+            return None
+        return Section(course_code, str(parallel), tuple(classes), tuple(exams))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return [section for section in executor.map(fetch, courses) if section is not None]
+
+
+def conflicts(sections):
+    '''
+    Sweep the meetings of each class day and exam date in order of start and
+    mark the sections whose meetings overlap
+    :param sections: list of Section
+    :return: list with a bitset per section of the sections it conflicts with
+    '''
+    days = {}
+    for position, section in enumerate(sections):
+        for meeting in section.classes:
+            days.setdefault(('class', meeting.day), []).append((meeting.start, meeting.end,
+                                                                 position))
+        for meeting in section.exams:
+            days.setdefault(('exam', meeting.day), []).append((meeting.start, meeting.end,
+                                                                position))
+    found = [0] * len(sections)
+    for intervals in days.values():
+        intervals.sort()
+        active = []
+        for start, end, position in intervals:
+            active = [item for item in active if item[0] > start]
+            for _, other in active:
+                if other != position:
+                    found[position] |= 1 << other
+                    found[other] |= 1 << position
+            active.append((end, position))
+    return found
+
+
+class Preferences():
+    '''
+    Preferences score a schedule, lower is better. The weights are in minutes:
+    every minute of class before earliest or after latest costs 1, every idle
+    minute between classes of a day costs gap_weight, every day with classes
+    costs day_weight and a parallel other than the preferred one costs
+    parallel_weight. free_days are never used.
+    '''
+
+    def __init__(self, earliest=None, latest=None, free_days=(), parallels=None,
+                 gap_weight=0.5, day_weight=60, parallel_weight=120, skip_weight=10000):
+        '''
+        :param earliest: time e.g. '08:00'
+        :param latest: time e.g. '17:00'
+        :param free_days: weekdays without classes e.g. ('VIERNES',)
+        :param parallels: dict course_code -> preferred parallel
+        :param skip_weight: cost of leaving out an optional course
+        '''
+        self.earliest = minutes(earliest) if earliest else None
+        self.latest = minutes(latest) if latest else None
+        self.free_days = {day.strip().upper() for day in free_days}
+        self.parallels = {course: str(parallel) for course, parallel in (parallels or {}).items()}
+        self.gap_weight = gap_weight
+        self.day_weight = day_weight
+        self.parallel_weight = parallel_weight
+        self.skip_weight = skip_weight
+
+    def allowed(self, section):
+        return not any(meeting.day in self.free_days for meeting in section.classes)
+
+    def section_cost(self, section):
+        '''
+        Cost that depends only on the section, it never decreases when more
+        sections are added, so it bounds the search
+        '''
+        cost = 0.0
+        for meeting in section.classes:
+            if self.earliest is not None and meeting.start < self.earliest:
+                cost += min(meeting.end, self.earliest) - meeting.start
+            if self.latest is not None and meeting.end > self.latest:
+                cost += meeting.end - max(meeting.start, self.latest)
+        preferred = self.parallels.get(section.course)
+        if preferred is not None and preferred != section.parallel:
+            cost += self.parallel_weight
+        return cost
+
+    def schedule_cost(self, sections):
+        '''
+        Cost of the days and idle time of a whole schedule
+        '''
+        days = {}
+        for section in sections:
+            for meeting in section.classes:
+                days.setdefault(meeting.day, []).append(meeting)
+        cost = self.day_weight * len(days)
+        for day in days.values():
+            day.sort()
+            busy = sum(meeting.end - meeting.start for meeting in day)
+            span = max(meeting.end for meeting in day) - day[0].start
+            cost += self.gap_weight * max(span - busy, 0)
+        return cost
+
+
+class ScheduleSolver():
+    '''
+    ScheduleSolver searches the combinations of one parallel per course
+    whose classes and exams do not overlap.
+
+    The conflicts are precomputed as bitsets, the search always branches on
+    the course with fewest parallels left, tries the cheapest parallels first
+    and drops a branch as soon as a required course has no parallel left, or
+    when ranking, as soon as it cannot beat the schedules already kept.
+    '''
+
+    def __init__(self, sections, preferences=None):
+        '''
+        :param sections: list of Section e.g. from fetch_sections
+        :param preferences: Preferences, by default no preferences
+        '''
+        self.preferences = preferences or Preferences()
+        self.sections = [section for section in sections if self.preferences.allowed(section)]
+        self.conflicts = conflicts(self.sections)
+        self.costs = [self.preferences.section_cost(section) for section in self.sections]
+        self.courses = {}
+        for position, section in enumerate(self.sections):
+            self.courses[section.course] = self.courses.get(section.course, 0) | 1 << position
+        # cheapest parallel of each course and bitset of the class days of each section
+        self.least = {course: min(self.costs[position] for position in _positions(mask))
+                      for course, mask in self.courses.items()}
+        weekdays = {}
+        self.days = [sum(1 << weekdays.setdefault(day, len(weekdays))
+                         for day in {meeting.day for meeting in section.classes})
+                     for section in self.sections]
+        self.nodes = 0
+
+    def __options(self, mask, blocked, days):
+        # cheapest parallels first, counting the days they add
+        weight = self.preferences.day_weight
+        return sorted(_positions(mask & ~blocked),
+                      key=lambda position: self.costs[position]
+                      + weight * _bits(self.days[position] & ~days))
+
+    def __estimate(self, required, optional, days, cost):
+        '''
+        Lower bound of the score of any schedule completing a branch: the days
+        with classes only grow and every course left costs at least its
+        cheapest parallel or being skipped
+        '''
+        skip = self.preferences.skip_weight
+        return (cost + self.preferences.day_weight * _bits(days)
+                + sum(self.least[course] for course in required)
+                + sum(min(self.least.get(course, skip), skip) for course in optional))
+
+    def __search(self, required, optional, blocked, days, chosen, cost, bound):
+        '''
+        :param bound: callable(estimate) that says if a branch may still be worth it
+        :return: generator of tuples (positions, skipped courses)
+        '''
+        self.nodes += 1
+        if not required and not optional:
+            yield chosen, ()
+            return
+        if bound is not None and not bound(self.__estimate(required, optional, days, cost)):
+            return
+        pending = required or optional
+        # the course with fewest parallels left, an empty one fails right away
+        course = min(pending, key=lambda name: _bits(self.courses.get(name, 0) & ~blocked))
+        rest_required = [name for name in required if name != course]
+        rest_optional = [name for name in optional if name != course]
+        for position in self.__options(self.courses.get(course, 0), blocked, days):
+            now_blocked = blocked | self.conflicts[position]
+            if any(not self.courses[name] & ~now_blocked for name in rest_required):
+                continue
+            yield from self.__search(rest_required, rest_optional, now_blocked,
+                                     days | self.days[position], chosen + (position,),
+                                     cost + self.costs[position], bound)
+        if course in optional:
+            for positions, skipped in self.__search(rest_required, rest_optional, blocked, days,
+                                                    chosen, cost + self.preferences.skip_weight,
+                                                    bound):
+                yield positions, (course,) + skipped
+
+    def __check(self, required, optional):
+        missing = [course for course in required if course not in self.courses]
+        if missing:
+            raise AttributeError('no allowed parallel with classes for {}'.format(
+                ', '.join(missing)))
+
+    def __schedule(self, positions, skipped):
+        sections = [self.sections[position] for position in positions]
+        score = (sum(self.costs[position] for position in positions)
+                 + self.preferences.schedule_cost(sections)
+                 + self.preferences.skip_weight * len(skipped))
+        return Schedule(score, tuple(sorted(sections)), tuple(sorted(skipped)))
+
+    def solutions(self, required=None, optional=()):
+        '''
+        Yield the valid schedules as they are found, good ones come first
+        :param required: course codes that must be taken, all by default
+        :param optional: course codes that may be left out, also those without parallels
+        :return: generator of Schedule
+        '''
+        optional = list(dict.fromkeys(optional))
+        if required is None:
+            required = [course for course in self.courses if course not in optional]
+        required = list(dict.fromkeys(required))
+        self.__check(required, optional)
+        for positions, skipped in self.__search(required, optional, 0, 0, (), 0.0, None):
+            yield self.__schedule(positions, skipped)
+
+    def best(self, limit=10, required=None, optional=(), max_nodes=None):
+        '''
+        Rank the schedules by the preferences with branch and bound
+        :param limit: number of schedules returned
+        :param max_nodes: stop after exploring these many nodes, the best found so far are returned
+        :return: list of Schedule sorted by score
+        '''
+        optional = list(dict.fromkeys(optional))
+        if required is None:
+            required = [course for course in self.courses if course not in optional]
+        required = list(dict.fromkeys(required))
+        self.__check(required, optional)
+        self.nodes = 0
+        heap = []
+
+        def bound(estimate):
+            if max_nodes is not None and self.nodes > max_nodes:
+                return False
+            # a branch that cannot beat the worst schedule kept is dropped
+            return len(heap) < limit or estimate < -heap[0][0]
+
+        for counter, (positions, skipped) in enumerate(
+                self.__search(required, optional, 0, 0, (), 0.0, bound)):
+            schedule = self.__schedule(positions, skipped)
+            if len(heap) < limit:
+                heapq.heappush(heap, (-schedule.score, counter, schedule))
+            elif schedule.score < -heap[0][0]:
+                heapq.heapreplace(heap, (-schedule.score, counter, schedule))
+        return [schedule for _, _, schedule in sorted(heap, key=lambda item: (-item[0], item[1]))]
+
+
+def _bits(mask):
+    '''
+    :return: number of bits set in mask, int.bit_count needs python 3.10
+    '''
+    return bin(mask).count('1')
+
+
+def _positions(mask):
+    '''
+    :return: generator of the positions of the bits set in mask
+    '''
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
@@ -0,0 +1,216 @@
+'''
+HTTP transports to send the raw SOAP requests
+'''
+import http.client
+import ssl
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+
+
+class UrllibTransport():
+    '''
+    UrllibTransport posts the request with urllib and returns the raw bytes
+    '''
+
+    def __init__(self, timeout=60):
+        '''
+        :param timeout: seconds to wait for the web service
+        '''
+        self.timeout = timeout
+
+    def post(self, url, body, headers, trace=None):
+        '''
+        Send a request
+        :param url: url of the web service
+        :param body: bytes of the request
+        :param headers: dict with the http headers
+        :param trace: optional Trace, gets the network and receive phases
+        :return: tuple (http status, bytes of the response)
+        '''
+        request = urllib.request.Request(url, data=body, headers=headers, method='POST')
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as error:
+            # SOAP faults come with status 500 and the fault in the body
+            response = error
+        with response:
+            if trace is not None:
+                trace.lap('network')
+            content = response.read()
+            if trace is not None:
+                trace.lap('receive')
+            return response.status, content
+
+
+class PooledTransport():
+    '''
+    PooledTransport keeps the connections alive between requests in a
+    bounded pool that may be shared by the clients of many threads, asks for
+    gzip or deflate responses and decompresses them while they are read.
+
+    A request over a reused connection that the server already closed is
+    sent again over a new one, the ws_* operations are all queries.
+    '''
+
+    def __init__(self, max_connections=8, connect_timeout=10, read_timeout=60,
+                 compression=True, chunk_size=65536):
+        '''
+        :param max_connections: requests in flight at the same time, the pool never has more connections
+        :param connect_timeout: seconds to open a connection
+        :param read_timeout: seconds to wait for the web service between reads
+        :param compression: ask for gzip or deflate responses
+        :param chunk_size: bytes read from the socket at once
+        '''
+        self.max_connections = max_connections
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self.__slots = threading.BoundedSemaphore(max_connections)
+        self.__lock = threading.Lock()
+        self.__idle = {}
+        self.__stats = dict.fromkeys(('requests', 'opened', 'reused', 'stale', 'closed',
+                                      'wire_bytes', 'content_bytes'), 0)
+
+    def __count(self, **amounts):
+        with self.__lock:
+            for name, amount in amounts.items():
+                self.__stats[name] += amount
+
+    def __connect(self, origin):
+        scheme, host, port = origin
+        if scheme == 'https':
+            connection = http.client.HTTPSConnection(host, port, timeout=self.connect_timeout,
+                                                     context=ssl.create_default_context())
+        else:
+            connection = http.client.HTTPConnection(host, port, timeout=self.connect_timeout)
+        connection.connect()
+        connection.sock.settimeout(self.read_timeout)
+        self.__count(opened=1)
+        return connection
+
+    def __checkout(self, origin):
+        '''
+        :return: tuple (connection, True if it was reused)
+        '''
+        with self.__lock:
+            idle = self.__idle.get(origin)
+            if idle:
+                return idle.pop(), True
+        return self.__connect(origin), False
+
+    def __checkin(self, origin, connection):
+        with self.__lock:
+            self.__idle.setdefault(origin, []).append(connection)
+
+    def __discard(self, connection):
+        connection.close()
+        self.__count(closed=1)
+
+    def post(self, url, body, headers, trace=None):
+        '''
+        Send a request
+        :param url: url of the web service
+        :param body: bytes of the request
+        :param headers: dict with the http headers
+        :param trace: optional Trace, gets the network and receive phases
+        :return: tuple (http status, decompressed bytes of the response)
+        '''
+        parts = urllib.parse.urlsplit(url)
+        origin = (parts.scheme, parts.hostname,
+                  parts.port or (443 if parts.scheme == 'https' else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        headers = dict(headers)
+        if self.compression:
+            headers.setdefault('Accept-Encoding', 'gzip, deflate')
+        with self.__slots:
+            self.__count(requests=1)
+            while True:
+                connection, reused = self.__checkout(origin)
+                try:
+                    connection.request('POST', path, body, headers)
+                    response = connection.getresponse()
+                except (http.client.RemoteDisconnected, ConnectionResetError,
+                        BrokenPipeError):
+                    self.__discard(connection)
+                    if not reused:
+                        raise
+                    # the server closed the idle connection, try a new one
+                    self.__count(stale=1)
+                    continue
+                except BaseException:
+                    self.__discard(connection)
+                    raise
+                if reused:
+                    self.__count(reused=1)
+                break
+            if trace is not None:
+                trace.lap('network')
+            try:
+                content = self.__read(response)
+            except BaseException:
+                self.__discard(connection)
+                raise
+            if trace is not None:
+                trace.lap('receive')
+            if response.will_close:
+                self.__discard(connection)
+            else:
+                self.__checkin(origin, connection)
+            return response.status, content
+
+    def __read(self, response):
+        '''
+        Read the body decompressing every chunk as it arrives
+        '''
+        encoding = (response.getheader('Content-Encoding') or 'identity').strip().lower()
+        if encoding not in ('gzip', 'deflate', 'identity'):
+            raise http.client.HTTPException('unsupported Content-Encoding ' + encoding)
+        decoder = None
+        if encoding == 'gzip':
+            decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks = []
+        wire = 0
+        while True:
+            chunk = response.read(self.chunk_size)
+            if not chunk:
+                break
+            wire += len(chunk)
+            if encoding == 'deflate' and decoder is None:
+                # deflate should come zlib wrapped but some servers send it raw
+                wrapped = (chunk[0] & 0x0f) == 8 and int.from_bytes(chunk[:2], 'big') % 31 == 0
+                decoder = zlib.decompressobj(zlib.MAX_WBITS if wrapped else -zlib.MAX_WBITS)
+            chunks.append(decoder.decompress(chunk) if decoder else chunk)
+        if decoder:
+            chunks.append(decoder.flush())
+        content = b''.join(chunks)
+        self.__count(wire_bytes=wire, content_bytes=len(content))
+        return content
+
+    def stats(self):
+        '''
+        :return: dict with the requests, connections opened, reused, stale (closed
+        by the server while idle) and closed, idle connections, bytes received
+        (wire_bytes) and decompressed (content_bytes) and the reuse ratio
+        '''
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats['idle'] = sum(len(idle) for idle in self.__idle.values())
+        stats['reuse_ratio'] = stats['reused'] / stats['requests'] if stats['requests'] else 0.0
+        return stats
+
+    def close(self):
+        '''
+        Close the idle connections
+        '''
+        with self.__lock:
+            idle = [connection for connections in self.__idle.values()
+                    for connection in connections]
+            self.__idle.clear()
+        for connection in idle:
+            self.__discard(connection)
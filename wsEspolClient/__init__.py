@@ -1 +1,25 @@
-from .Client import Client
+'''
+The classes are imported on first use, so the front ends that only talk
+to the daemon do not pay for importing pysimplesoap
+'''
+import importlib
+
+EXPORTS = {
+    'Client': '.Client',
+    'AsyncClient': '.AsyncClient',
+    'ResponseCache': '.ResponseCache',
+    'PersonIndex': '.PersonIndex',
+    'Metrics': '.Metrics',
+    'ResilientClient': '.Resilience',
+    'DaemonClient': '.Daemon',
+}
+
+__all__ = sorted(EXPORTS)
+
+
+def __getattr__(name):
+    module = EXPORTS.get(name)
+    if module is None:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    value = globals()[name] = getattr(importlib.import_module(module, __name__), name)
+    return value
@@ -0,0 +1,55 @@
+'''
+wsExport streams grades, rosters and schedules to NDJSON, CSV, Parquet or Arrow files
+:argv 1: what to export: grades, roster, class_hours or exam_dates
+
+$python3 wsExport.py grades --checkpoint <grades.jsonl> -o <output>
+$python3 wsExport.py grades --students <code>... --years <first> <last> -o <output>
+$python3 wsExport.py <roster|class_hours|exam_dates> <course:parallel>... -o <output>
+
+Example: $ python3 wsExport.py grades --checkpoint grades.jsonl -o grades.parquet
+         $ python3 wsExport.py roster ICM00604:1 ICM00604:2 -o roster.csv
+The format is taken from the extension of the output (.ndjson/.jsonl, .csv,
+.parquet, .arrow) or from --format. Parquet and Arrow need pyarrow.
+'''
+import argparse
+
+from wsEspolClient import Client
+from wsEspolClient.Export import FORMATS, checkpoint_rows, course_rows, export, grade_rows
+from wsEspolClient.GradeHarvester import periods
+from wsHarvester import parse_course
+
+
+COURSE_METHODS = {
+    'roster': 'ws_estudiantes_registrados',
+    'class_hours': 'ws_horario_clases',
+    'exam_dates': 'ws_horario_examenes',
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export Espol data to files')
+    parser.add_argument('data', choices=['grades'] + sorted(COURSE_METHODS))
+    parser.add_argument('courses', nargs='*', type=parse_course)
+    parser.add_argument('-o', '--output', required=True)
+    parser.add_argument('--format', choices=FORMATS)
+    parser.add_argument('--row-group-size', type=int, default=50000)
+    parser.add_argument('--checkpoint', help='json lines file written by wsHarvester')
+    parser.add_argument('--students', nargs='+', default=[])
+    parser.add_argument('--years', nargs=2, metavar=('FIRST', 'LAST'))
+    parser.add_argument('--terms', nargs='+', default=['1', '2'])
+    args = parser.parse_args()
+
+    if args.data == 'grades':
+        if args.checkpoint:
+            rows = checkpoint_rows(args.checkpoint)
+        elif args.students and args.years:
+            rows = grade_rows(Client(), args.students, periods(*args.years, terms=args.terms))
+        else:
+            parser.error('grades need --checkpoint or --students with --years')
+    elif args.courses:
+        rows = course_rows(Client(), COURSE_METHODS[args.data], args.courses)
+    else:
+        parser.error('{} needs at least one <course:parallel>'.format(args.data))
+
+    count = export(rows, args.output, args.data, args.format, args.row_group_size)
+    print("{} rows exported to {}".format(count, args.output))
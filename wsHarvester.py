@@ -0,0 +1,46 @@
+'''
+wsHarvester get the grades of every student registered in some courses
+:argv: course codes with its parallel, years and terms
+
+$python3 wsHarvester.py <course:parallel>... --years <first> <last> [--terms 1 2]
+                        [--checkpoint grades.jsonl] [--workers 8]
+
+Example: $ python3 wsHarvester.py ICM00604:1 ICM00604:2 --years 2015 2017
+Run it again with the same checkpoint to resume an interrupted harvest.
+'''
+import argparse
+import sys
+
+from wsEspolClient.GradeHarvester import GradeHarvester, periods
+from wsEspolClient.Resilience import resilient_factory
+
+
+def parse_course(value):
+    course_code, _, parallel = value.partition(':')
+    if not course_code.isalnum() or not parallel.isdigit():
+        raise argparse.ArgumentTypeError('course must be <code>:<parallel> e.g. ICM00604:1')
+    return course_code, parallel
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Harvest the grades of some courses')
+    parser.add_argument('courses', nargs='+', type=parse_course)
+    parser.add_argument('--years', nargs=2, required=True, metavar=('FIRST', 'LAST'))
+    parser.add_argument('--terms', nargs='+', default=['1', '2'])
+    parser.add_argument('--checkpoint', default='grades.jsonl')
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    # the workers share the limit, so the harvest goes as fast as the web service allows
+    harvester = GradeHarvester(args.checkpoint, workers=args.workers,
+                               client_factory=resilient_factory(args.workers))
+    try:
+        progress = harvester.run(args.courses, periods(*args.years, terms=args.terms))
+    except KeyboardInterrupt:
+        print("Interrupted, run it again to resume :)")
+        sys.exit(1)
+    if progress.failed:
+        print("{} units failed, run it again to retry them".format(progress.failed))
+    if harvester.failed_courses:
+        print("The roster of {} failed, run it again to retry them".format(
+            ', '.join('{}:{}'.format(*course) for course in harvester.failed_courses)))
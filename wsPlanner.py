@@ -0,0 +1,107 @@
+'''
+wsPlanner finds timetables without overlapping classes or exams among the
+parallels of the courses a student may enroll in
+:argv 1: student code
+
+$python3 wsPlanner.py <student> [--courses <code> ...] [--optional <code> ...]
+                      [--earliest 08:00] [--latest 17:00] [--free-days VIERNES]
+                      [--prefer <code>=<parallel> ...] [--limit 5] [--workers 8]
+
+Example: $ python3 wsPlanner.py 201304614 --free-days VIERNES --earliest 08:00
+         $ python3 wsPlanner.py 201304614 --courses ICM00604 FIEC04341 --optional ICM01974
+The courses are the available ones of the student unless --courses is given,
+every parallel from 1 to --max-parallels is tried for a course listed without one.
+'''
+import argparse
+import sys
+
+from tabulate import tabulate
+
+from wsEspolClient.Resilience import resilient_factory
+from wsEspolClient.Schedule import Preferences, ScheduleSolver, available_courses, fetch_sections
+
+
+WEEKDAYS = ('LUNES', 'MARTES', 'MIERCOLES', 'JUEVES', 'VIERNES', 'SABADO', 'DOMINGO')
+
+
+def parse_preference(value):
+    course, _, parallel = value.partition('=')
+    if not course or not parallel.isdigit():
+        raise argparse.ArgumentTypeError('preference must be <course>=<parallel>')
+    return course, parallel
+
+
+def clock(value):
+    return '%02d:%02d' % divmod(value, 60)
+
+
+def schedule_table(schedule):
+    rows = []
+    for section in schedule.sections:
+        for meeting in sorted(section.classes, key=lambda meeting: (
+                WEEKDAYS.index(meeting.day) if meeting.day in WEEKDAYS else len(WEEKDAYS),
+                meeting.day, meeting.start)):
+            rows.append([section.course, section.parallel, 'CLASE', meeting.day,
+                         clock(meeting.start), clock(meeting.end)])
+        for meeting in sorted(section.exams):
+            rows.append([section.course, section.parallel, 'EXAMEN', meeting.day,
+                         clock(meeting.start), clock(meeting.end)])
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Timetables without conflicts')
+    parser.add_argument('student')
+    parser.add_argument('--courses', nargs='+', help='required courses, all available by default')
+    parser.add_argument('--optional', nargs='+', default=[], help='courses that may be left out')
+    parser.add_argument('--earliest', help='classes should not start before, e.g. 08:00')
+    parser.add_argument('--latest', help='classes should not end after, e.g. 17:00')
+    parser.add_argument('--free-days', nargs='+', default=[], metavar='DAY')
+    parser.add_argument('--prefer', nargs='+', type=parse_preference, default=[],
+                        metavar='COURSE=PARALLEL')
+    parser.add_argument('--limit', type=int, default=5)
+    parser.add_argument('--max-parallels', type=int, default=6)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    client_factory = resilient_factory(args.workers)
+    try:
+        courses = available_courses(client_factory(), args.student, args.max_parallels)
+    except Exception as error:
+        print("The available courses failed: {}: {}".format(type(error).__name__, error))
+        sys.exit(1)
+    wanted = set(args.courses or []) | set(args.optional)
+    if wanted:
+        known = {course for course, _ in courses}
+        # courses asked for but not listed as available are looked up anyway
+        courses = [course for course in courses if course[0] in wanted] + [
+            (course, str(number)) for course in sorted(wanted - known)
+            for number in range(1, args.max_parallels + 1)]
+    if not courses:
+        print("No available courses")
+        sys.exit(0)
+
+    preferences = Preferences(args.earliest, args.latest, args.free_days, dict(args.prefer))
+    errors = []
+    solver = ScheduleSolver(fetch_sections(courses, args.workers, client_factory, errors),
+                            preferences)
+    if errors:
+        print("The timetables of {} parallels failed and were left out: {}".format(
+            len(errors), ', '.join(sorted('{}:{}'.format(course, parallel)
+                                          for course, parallel, _ in errors))),
+              file=sys.stderr)
+    try:
+        schedules = solver.best(args.limit, args.courses, args.optional)
+    except AttributeError as error:
+        print(error)
+        sys.exit(1)
+    if not schedules:
+        print("No timetable without conflicts")
+        sys.exit(1)
+    for number, schedule in enumerate(schedules, 1):
+        print("Option {} (score {:.0f})".format(number, schedule.score))
+        if schedule.skipped:
+            print("Left out: " + ', '.join(schedule.skipped))
+        print(tabulate(schedule_table(schedule),
+                       headers=['MATERIA', 'PARALELO', 'TIPO', 'DIA', 'INICIO', 'FIN']))
+        print()
@@ -6,40 +6,33 @@ wsSpider get grades from student input
 :argv 4: term
 
 $python3 wsSpider <name> <lastname> <year> <term>
+$python3 wsSpider --batch <queries.csv|-> [--format table|jsonl|csv] [--policy skip|first|all]
+                  [--workers 8]
 
 Example: $ python3 wsSpider.py John Doe 2017 1
          $ python3 wsSpider.py Oscar 'De la Olla' 2014 2
+         $ python3 wsSpider.py --batch queries.csv --format jsonl > grades.jsonl
+In batch mode every line of the queries is name,lastname,year,term or
+code,year,term and a name that matches several people is resolved by the
+policy instead of asking: skip reports it, first takes the lowest student
+code and all looks up everyone.
 '''
 import sys
-from tabulate import tabulate
 
-from wsEspolClient import Client
+# the heavy imports are done only when no daemon is running (see wsDaemon.py)
+from wsEspolClient.Daemon import DaemonClient, error_name
 
 
-def remove_unused_chars(string):
-    return string.replace('&nbsp;', '')
+separator = '===' * 50
+line_break = '\n'
+table_header = ['MATERIA', 'PARCIAL', 'FINAL',
+                'MEJORAMIENTO', 'PROMEDIO', 'ESTADO', 'VEZ']
 
 
 def processing_grades(grades):
-    if isinstance(grades, dict):
-        # if 1 course
-        result = [grades.get('MATERIA'), grades.get('NOTA1'), grades.get('NOTA2'),
-                  grades.get('NOTA3'), grades.get('PROMEDIO'),
-                  remove_unused_chars(grades.get('ESTADO')),
-                  grades.get('VEZ')]
-        grades_table.append(result)
-        print(tabulate(grades_table, headers=table_header,
-                       tablefmt="fancy_grid"))
-        print(line_break)
-        print(separator)
-    elif isinstance(grades, list):
-        # if group of courses
-        for grade in grades:
-            course = [grade.get('MATERIA'), grade.get('NOTA1'), grade.get('NOTA2'),
-                      grade.get('NOTA3'), grade.get('PROMEDIO'),
-                      remove_unused_chars(grade.get('ESTADO')),
-                      grade.get('VEZ')]
-            grades_table.append(course)
+    if grades:
+        grades_table = [[grade.MATERIA, grade.NOTA1, grade.NOTA2, grade.NOTA3,
+                         grade.PROMEDIO, grade.ESTADO, grade.VEZ] for grade in grades]
         print(tabulate(grades_table, headers=table_header,
                        tablefmt="fancy_grid"))
         print(line_break)
@@ -56,49 +49,137 @@ def print_info_student(name, lastname, student_code):
     print("CODIGO: {}".format(student_code))
     print(line_break)
 
+
+def local_session(workers=1):
+    '''
+    :param workers: number of threads that will use the clients
+    :return: tuple (client factory, search of people, tabulate) working in this process
+    '''
+    import atexit
+
+    from tabulate import tabulate
+    from wsEspolClient import PersonIndex
+    from wsEspolClient.PersonIndex import search_people
+    from wsEspolClient.Resilience import resilient_factory
+
+    # the clients of every thread share the limits, the connections and the index
+    index = PersonIndex.load()
+    # the index is written every PersonIndex.save_every changes and on exit
+    atexit.register(index.save)
+    return (resilient_factory(workers),
+            lambda client, name, lastname: search_people(client, index, name, lastname),
+            tabulate)
+
+
+def batch_arguments(argv):
+    import argparse
+    from wsEspolClient.Batch import POLICIES
+
+    parser = argparse.ArgumentParser(prog='wsSpider.py --batch',
+                                     description='Look up the grades of many students')
+    parser.add_argument('queries', help='csv file with name,lastname,year,term or '
+                                        'code,year,term per line, - to read stdin')
+    parser.add_argument('--format', choices=('table', 'jsonl', 'csv'), default='table')
+    parser.add_argument('--policy', choices=POLICIES, default='skip')
+    parser.add_argument('--workers', type=int, default=8)
+    return parser.parse_args(argv)
+
+
+def print_result(result):
+    '''
+    Print a result of the batch mode as soon as it arrives
+    '''
+    query = result.query
+    if result.status == 'ok':
+        student = result.student
+        print_info_student(student.NOMBRES or '', student.APELLIDOS or '',
+                           student.CODESTUDIANTE)
+        processing_grades(result.grades)
+    else:
+        print(separator)
+        print("LINEA {}: {} ({})".format(query.line, query.code or ' '.join(
+            filter(None, (query.name, query.lastname))), result.status))
+        if result.error:
+            print(result.error)
+    sys.stdout.flush()
+
+
+def batch(args, client_factory, search):
+    '''
+    Run the batch mode
+    :return: exit status, 1 if some query failed
+    '''
+    from wsEspolClient.Batch import BatchRunner, ResultWriter
+
+    runner = BatchRunner(client_factory, search, args.workers, args.policy)
+    if args.format == 'table':
+        write, close = print_result, lambda: None
+    else:
+        output = ResultWriter(sys.stdout, args.format)
+        write, close = output.write, output.close
+    failed = 0
+    lines = sys.stdin if args.queries == '-' else open(args.queries, encoding='utf-8')
+    try:
+        for result in runner.run(lines):
+            write(result)
+            failed += result.status in ('error', 'invalid')
+    finally:
+        close()
+        lines.close()
+    return 1 if failed else 0
+
+
 if __name__ == '__main__':
-    client = Client()
+    args = batch_arguments(sys.argv[2:]) if sys.argv[1:2] == ['--batch'] else None
+
+    client = DaemonClient.connect()
+    if client is not None:
+        # one connection to the daemon per thread
+        client_factory, tabulate = DaemonClient, client.tabulate
+        search = lambda client, name, lastname: client.search_people(name, lastname)
+    else:
+        client_factory, search, tabulate = local_session(args.workers if args else 1)
+        client = client_factory()
 
-    separator = '===' * 50
-    line_break = '\n'
-    table_header = ['MATERIA', 'PARCIAL', 'FINAL',
-                    'MEJORAMIENTO', 'PROMEDIO', 'ESTADO', 'VEZ']
+    if args:
+        sys.exit(batch(args, client_factory, search))
 
     name = sys.argv[1]
     lastname = sys.argv[2]
     year = sys.argv[3]
     term = sys.argv[4]
 
-    grades_table = []
-
     try:
-        student = client.ws_consultar_persona_nombres(name, lastname)
-        if isinstance(student, dict):
+        students = search(client, name, lastname)
+        if len(students) == 1:
             # if ws return 1 person
-            print_info_student(student.get('NOMBRES'), student.get(
-                'APELLIDOS'), student.get('CODESTUDIANTE'))
+            student = students[0]
+            print_info_student(student.NOMBRES, student.APELLIDOS, student.CODESTUDIANTE)
             try:
                 grades = client.ws_consulta_calificaciones(
-                    year, term, student.get('CODESTUDIANTE'))
+                    year, term, student.CODESTUDIANTE)
                 processing_grades(grades)
             except Exception as e:
                 print("Something went wrong looking the grades :(")
-        elif isinstance(student, list):
+        elif students:
             # if ws return some people
             print(line_break)
-            for index, element in enumerate(student):
-                print("{} - {} {} {}".format(index + 1, element.get('NOMBRES'),
-                                            element.get('APELLIDOS'), element.get('CODESTUDIANTE')))
+            for index, element in enumerate(students):
+                print("{} - {} {} {}".format(index + 1, element.NOMBRES,
+                                            element.APELLIDOS, element.CODESTUDIANTE))
             print(line_break)
             op = input("Ingrese el numero de la persona a consultar: ")
             print(line_break)
-            tmp_student = student[int(op) - 1]
-            print_info_student(tmp_student.get('NOMBRES'), tmp_student.get(
-                'APELLIDOS'), tmp_student.get('CODESTUDIANTE'))
+            tmp_student = students[int(op) - 1]
+            print_info_student(tmp_student.NOMBRES, tmp_student.APELLIDOS,
+                               tmp_student.CODESTUDIANTE)
             grades = client.ws_consulta_calificaciones(
-                year, term, tmp_student.get('CODESTUDIANTE'))
+                year, term, tmp_student.CODESTUDIANTE)
             processing_grades(grades)
         else:
             print('Oops, There are no people with that name')
-    except Exception:
-        print("Something went wrong searching this student :(")
+    except Exception as error:
+        if error_name(error) == 'CircuitOpenError':
+            print("The web service is down, try again later :(")
+        else:
+            print("Something went wrong searching this student :(")
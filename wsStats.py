@@ -0,0 +1,54 @@
+'''
+wsStats computes pass rates, averages and attempt distributions of harvested grades
+:argv 1: grades file, a wsHarvester checkpoint (.jsonl) or a wsExport parquet file
+
+$python3 wsStats.py <grades.jsonl|grades.parquet> [--by course term] [--where course=<name>]
+                    [--distribution VEZ]
+
+Example: $ python3 wsStats.py grades.jsonl --by course
+         $ python3 wsStats.py grades.parquet --by year term --where 'course=FISICA I'
+         $ python3 wsStats.py grades.jsonl --by course --distribution VEZ
+The dimensions are course, student, year, term, parallel and estado, --distribution
+counts VEZ, year, term, parallel or estado. Needs numpy.
+'''
+import argparse
+
+from tabulate import tabulate
+
+from wsEspolClient.Analytics import DIMENSIONS, DISTRIBUTIONS, METRICS, GradeAnalytics
+
+
+def parse_filter(value):
+    dimension, _, expected = value.partition('=')
+    if dimension not in DIMENSIONS or not expected:
+        raise argparse.ArgumentTypeError('filter must be <dimension>=<value> with a dimension '
+                                         'in ' + ', '.join(DIMENSIONS))
+    return dimension, expected
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Statistics of harvested grades')
+    parser.add_argument('grades')
+    parser.add_argument('--by', nargs='+', choices=sorted(DIMENSIONS), default=['course'])
+    parser.add_argument('--where', nargs='+', type=parse_filter, default=[])
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS,
+                        help='count the values of VEZ or of a small dimension per group')
+    args = parser.parse_args()
+
+    if args.grades.endswith('.parquet'):
+        analytics = GradeAnalytics.from_parquet(args.grades)
+    else:
+        analytics = GradeAnalytics.from_checkpoint(args.grades)
+    where = dict(args.where)
+
+    if args.distribution:
+        counts = analytics.distribution(args.distribution, args.by, where)
+        values = sorted({value for group in counts.values() for value in group},
+                        key=lambda value: (value is None, str(value)))
+        table = [list(group) + [counts[group].get(value, 0) for value in values]
+                 for group in sorted(counts, key=str)]
+        print(tabulate(table, headers=args.by + values))
+    else:
+        groups = analytics.aggregate(args.by, where)
+        print(tabulate(groups, headers=args.by + list(METRICS), floatfmt='.2f'))
+    print("{} rows".format(len(analytics)))
@@ -0,0 +1,53 @@
+'''
+wsWatch polls the grades of many students and prints only what changed
+since the previous poll, one json object per changed field
+:argv 1: file with one student code per line, - to read stdin
+
+$python3 wsWatch.py <students.txt|-> [--year <year> --term <term>]
+                    [--db ~/.wsSp1d3r/changes.sqlite3] [--workers 8]
+
+Example: $ python3 wsWatch.py students.txt >> changes.jsonl
+The term is the current one of the web service unless --year and --term
+are given. The first poll of a student reports all of its grades.
+'''
+import argparse
+import json
+import sys
+
+from wsEspolClient.ChangeTracker import DEFAULT_PATH, ChangeTracker
+from wsEspolClient.Resilience import resilient_factory
+
+
+def read_students(lines):
+    for line in lines:
+        code = line.strip()
+        if code.isdigit():
+            yield code
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print the grades that changed')
+    parser.add_argument('students', help='file with one student code per line, - for stdin')
+    parser.add_argument('--year')
+    parser.add_argument('--term')
+    parser.add_argument('--db', default=DEFAULT_PATH)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+    if bool(args.year) != bool(args.term):
+        parser.error('--year and --term go together')
+
+    tracker = ChangeTracker(args.db)
+    lines = sys.stdin if args.students == '-' else open(args.students, encoding='utf-8')
+    try:
+        changes = tracker.poll(read_students(lines), args.year, args.term, args.workers,
+                               client_factory=resilient_factory(args.workers))
+        for change in changes:
+            print(json.dumps(change._asdict(), ensure_ascii=False), flush=True)
+    except KeyboardInterrupt:
+        sys.exit(1)
+    finally:
+        lines.close()
+        stats = tracker.stats()
+        tracker.close()
+    print("{checked} checked, {changed} changed, {failed} failed".format(**stats),
+          file=sys.stderr)